@@ -11,9 +11,7 @@ class Charger:
 
     def refill_batteries(self, charger_vertex):
         self.available_batteries = self.graph.nodes[charger_vertex]["capacity"]
-        self.graph.update_node(
-            charger_vertex, {"status": "1", "time_charge_remaining": TIME_FOR_CHARGE}
-        )
+        self.graph.schedule_locker(charger_vertex, TIME_FOR_CHARGE)
 
     def distribute_batteries(self, parking_vertex, target_level):
         scooters = self.graph.get_low_scooters_on_parking(parking_vertex, target_level)
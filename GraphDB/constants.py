@@ -2,3 +2,8 @@ TIME_FOR_CHARGE = 250
 DECREASE_PER_ITERATION = 0.3
 TARGET_LEVEL = 80
 CAN_WRITE = True
+WRITE_BUFFER_SIZE = 1000
+WRITE_FLUSH_INTERVAL = 5
+CANDIDATES_LIMIT = 20
+METRICS_ENABLED = False
+METRICS_CAPACITY = 1000
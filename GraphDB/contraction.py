@@ -0,0 +1,308 @@
+"""
+Иерархия сжатия (contraction hierarchies) над графом PATH парковок и шкафов.
+Предназначена для больших разреженных графов (см. connections="knn"), на которых
+матрица всех пар не помещается в память: после предобработки точечный запрос
+выполняет два маленьких поиска вверх по иерархии.
+"""
+import hashlib
+import heapq
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+class ContractionHierarchy:
+    # Ограничение количества вершин, просматриваемых при поиске свидетеля
+    WITNESS_SETTLE_LIMIT = 60
+
+    def __init__(
+        self,
+        nodes: List[int],
+        rank: List[int],
+        up: List[List[Tuple[int, float]]],
+        middles: Dict[Tuple[int, int], int],
+        fingerprint: str = "",
+    ):
+        """
+        :param rank: порядок сжатия вершин
+        :param up: рёбра каждой вершины к вершинам с большим рангом (индекс, вес)
+        :param middles: средняя вершина каждого ребра-сокращения (меньший индекс, больший индекс)
+        :param fingerprint: отпечаток исходного графа для проверки сохранённой иерархии
+        """
+        self.nodes = nodes
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.rank = rank
+        self.up = up
+        self.middles = middles
+        self.fingerprint = fingerprint
+
+    def __contains__(self, node) -> bool:
+        return node in self.index
+
+    @staticmethod
+    def graph_fingerprint(nodes: List[int], edges: List[Tuple[int, int, float]]) -> str:
+        """
+        sha1 отсортированных идентификаторов вершин и рёбер (меньший конец, больший конец, вес):
+        совпадает только у графов с теми же вершинами и рёбрами, в каком бы порядке их ни добавляли.
+        """
+        node_ids = np.sort(np.array(nodes, dtype=np.int64))
+        u = np.array([e[0] for e in edges], dtype=np.int64)
+        v = np.array([e[1] for e in edges], dtype=np.int64)
+        w = np.array([e[2] for e in edges], dtype=np.float64)
+        a, b = np.minimum(u, v), np.maximum(u, v)
+        order = np.lexsort((w, b, a))
+        digest = hashlib.sha1()
+        for array in (node_ids, a[order], b[order], w[order]):
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def from_graph(cls, graph) -> "ContractionHierarchy":
+        nodes, edges = cls._graph_data(graph)
+        return cls.build(nodes, edges)
+
+    @staticmethod
+    def _graph_data(graph) -> Tuple[List[int], List[Tuple[int, int, float]]]:
+        nodes = graph.exclude_type("scooter")
+        members = set(nodes)
+        edges = [
+            (u, v, data["time_to_travel"])
+            for u, v, data in graph.edges(data=True)
+            if "time_to_travel" in data and u in members and v in members
+        ]
+        return nodes, edges
+
+    @classmethod
+    def build(
+        cls, nodes: Iterable[int], edges: Iterable[Tuple[int, int, float]]
+    ) -> "ContractionHierarchy":
+        nodes = list(nodes)
+        edges = list(edges)
+        index = {node: i for i, node in enumerate(nodes)}
+        n = len(nodes)
+        adj: List[Dict[int, float]] = [{} for _ in range(n)]
+        for u, v, w in edges:
+            i, j = index[u], index[v]
+            if i != j and w < adj[i].get(j, float("inf")):
+                adj[i][j] = adj[j][i] = w
+
+        limit = cls.WITNESS_SETTLE_LIMIT
+
+        def witness(source: int, excluded: int, targets: Dict[int, float], max_cost: float):
+            dist = {source: 0}
+            found = {}
+            pq = [(0, source)]
+            settled = 0
+            while pq and settled < limit:
+                d, x = heapq.heappop(pq)
+                if d > dist[x]:
+                    continue
+                if d > max_cost:
+                    break
+                settled += 1
+                if x in targets and x not in found:
+                    found[x] = d
+                    if len(found) == len(targets):
+                        break
+                for y, w in adj[x].items():
+                    if y == excluded:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(y, float("inf")):
+                        dist[y] = nd
+                        heapq.heappush(pq, (nd, y))
+            return found
+
+        def shortcuts(v: int) -> List[Tuple[int, int, float]]:
+            neighbours = list(adj[v].items())
+            result = []
+            for a, (u, wu) in enumerate(neighbours):
+                targets = {w: wu + ww for w, ww in neighbours[a + 1 :]}
+                if not targets:
+                    continue
+                found = witness(u, v, targets, max(targets.values()))
+                for w, cost in targets.items():
+                    if found.get(w, float("inf")) > cost:
+                        result.append((u, w, cost))
+            return result
+
+        deleted = [0] * n
+        contracted = [False] * n
+        rank = [0] * n
+        up: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        middles: Dict[Tuple[int, int], int] = {}
+
+        def priority(v: int, needed: list) -> int:
+            return len(needed) - len(adj[v]) + deleted[v]
+
+        pq = []
+        for v in range(n):
+            pq.append((priority(v, shortcuts(v)), v))
+        heapq.heapify(pq)
+
+        order = 0
+        while pq:
+            _, v = heapq.heappop(pq)
+            if contracted[v]:
+                continue
+            # Ленивое обновление: приоритет пересчитывается перед сжатием
+            needed = shortcuts(v)
+            current = priority(v, needed)
+            if pq and current > pq[0][0]:
+                heapq.heappush(pq, (current, v))
+                continue
+            for u, w, cost in needed:
+                if cost < adj[u].get(w, float("inf")):
+                    adj[u][w] = adj[w][u] = cost
+                    middles[(min(u, w), max(u, w))] = v
+            up[v] = list(adj[v].items())
+            for u in adj[v]:
+                del adj[u][v]
+                deleted[u] += 1
+            adj[v] = {}
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+
+        return cls(nodes, rank, up, middles, cls.graph_fingerprint(nodes, edges))
+
+    def _upward(self, source: int, bound: float = float("inf")):
+        dist = {source: 0}
+        prev = {source: None}
+        pq = [(0, source)]
+        while pq:
+            d, x = heapq.heappop(pq)
+            if d > dist[x]:
+                continue
+            if d >= bound:
+                break
+            for y, w in self.up[x]:
+                nd = d + w
+                if nd < dist.get(y, float("inf")):
+                    dist[y] = nd
+                    prev[y] = x
+                    heapq.heappush(pq, (nd, y))
+        return dist, prev
+
+    def _unpack(self, a: int, b: int) -> List[int]:
+        """
+        Разворачивает ребро иерархии a-b в путь по исходным рёбрам (без вершины a).
+        """
+        path = []
+        stack = [(a, b)]
+        while stack:
+            x, y = stack.pop()
+            middle = self.middles.get((min(x, y), max(x, y)))
+            if middle is None:
+                path.append(y)
+            else:
+                stack.append((middle, y))
+                stack.append((x, middle))
+        return path
+
+    def query(self, start: int, end: int) -> Tuple[List[int], float] | None:
+        """
+        Кратчайшее время пути и полный путь по исходным рёбрам.
+        """
+        s, t = self.index[start], self.index[end]
+        if s == t:
+            return [start], 0
+        forward, forward_prev = self._upward(s)
+        best = float("inf")
+        meeting = None
+        backward = {t: 0}
+        backward_prev = {t: None}
+        pq = [(0, t)]
+        while pq:
+            d, x = heapq.heappop(pq)
+            if d > backward[x]:
+                continue
+            if d >= best:
+                break
+            if x in forward and forward[x] + d < best:
+                best = forward[x] + d
+                meeting = x
+            for y, w in self.up[x]:
+                nd = d + w
+                if nd < backward.get(y, float("inf")):
+                    backward[y] = nd
+                    backward_prev[y] = x
+                    heapq.heappush(pq, (nd, y))
+        if meeting is None:
+            return None
+
+        up_chain = []
+        x = meeting
+        while x is not None:
+            up_chain.append(x)
+            x = forward_prev[x]
+        up_chain.reverse()
+        down_chain = []
+        x = backward_prev[meeting]
+        while x is not None:
+            down_chain.append(x)
+            x = backward_prev[x]
+
+        path = [s]
+        chain = up_chain + down_chain
+        for a, b in zip(chain, chain[1:]):
+            path += self._unpack(a, b)
+        return [self.nodes[i] for i in path], best
+
+    def save(self, path: str) -> None:
+        up_u = [u for u, edges in enumerate(self.up) for _ in edges]
+        up_v = [v for edges in self.up for v, _ in edges]
+        up_w = [w for edges in self.up for _, w in edges]
+        keys = list(self.middles)
+        with open(path, "wb") as file:
+            np.savez_compressed(
+                file,
+                nodes=np.array(self.nodes, dtype=np.int64),
+                rank=np.array(self.rank, dtype=np.int64),
+                up_u=np.array(up_u, dtype=np.int64),
+                up_v=np.array(up_v, dtype=np.int64),
+                up_w=np.array(up_w, dtype=np.float64),
+                middle_a=np.array([a for a, _ in keys], dtype=np.int64),
+                middle_b=np.array([b for _, b in keys], dtype=np.int64),
+                middle=np.array([self.middles[k] for k in keys], dtype=np.int64),
+                fingerprint=np.array(self.fingerprint),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        with np.load(path) as data:
+            nodes = data["nodes"].tolist()
+            rank = data["rank"].tolist()
+            up: List[List[Tuple[int, float]]] = [[] for _ in nodes]
+            for u, v, w in zip(
+                data["up_u"].tolist(), data["up_v"].tolist(), data["up_w"].tolist()
+            ):
+                up[u].append((v, w))
+            middles = {
+                (a, b): m
+                for a, b, m in zip(
+                    data["middle_a"].tolist(), data["middle_b"].tolist(), data["middle"].tolist()
+                )
+            }
+            fingerprint = data["fingerprint"]
+            # В файлах прошлого формата отпечаток - массив чисел: такая иерархия перестраивается
+            fingerprint = str(fingerprint.item()) if fingerprint.ndim == 0 else ""
+        return cls(nodes, rank, up, middles, fingerprint)
+
+    @classmethod
+    def for_graph(cls, graph, path: str | None = None) -> "ContractionHierarchy":
+        """
+        Загружает иерархию из файла, если она построена для этого же графа,
+        иначе строит заново и сохраняет в path.
+        """
+        nodes, edges = cls._graph_data(graph)
+        fingerprint = cls.graph_fingerprint(nodes, edges)
+        if path is not None and os.path.exists(path):
+            hierarchy = cls.load(path)
+            if hierarchy.fingerprint == fingerprint:
+                return hierarchy
+        hierarchy = cls.build(nodes, edges)
+        if path is not None:
+            hierarchy.save(path)
+        return hierarchy
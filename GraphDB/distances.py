@@ -0,0 +1,69 @@
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+class DistanceMatrix:
+    """
+    Предпосчитанные кратчайшие времена пути между всеми парковками и шкафами.
+    Строится алгоритмом Флойда-Уоршелла по рёбрам PATH, хранит матрицу
+    расстояний и матрицу следующих вершин для восстановления пути.
+    """
+
+    def __init__(self, nodes: Iterable[int], edges: Iterable[Tuple[int, int, float]]):
+        self.nodes = list(nodes)
+        self.index: Dict[int, int] = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        dist = np.full((n, n), np.inf)
+        next_hop = np.full((n, n), -1, dtype=np.int32)
+        np.fill_diagonal(dist, 0)
+        np.fill_diagonal(next_hop, np.arange(n, dtype=np.int32))
+        for u, v, time_to_travel in edges:
+            i, j = self.index[u], self.index[v]
+            if time_to_travel < dist[i, j]:
+                dist[i, j] = dist[j, i] = time_to_travel
+                next_hop[i, j] = j
+                next_hop[j, i] = i
+
+        # Матрицы обновляются на месте через два буфера, выделенные один раз,
+        # а не новыми массивами на каждом шаге k
+        via = np.empty_like(dist)
+        better = np.empty((n, n), dtype=bool)
+        for k in range(n):
+            np.add(dist[:, k, None], dist[None, k, :], out=via)
+            np.less(via, dist, out=better)
+            np.copyto(dist, via, where=better)
+            np.copyto(next_hop, next_hop[:, k, None], where=better)
+
+        self.dist = dist
+        self.next_hop = next_hop
+
+    @classmethod
+    def from_graph(cls, graph) -> "DistanceMatrix":
+        nodes = graph.exclude_type("scooter")
+        index = set(nodes)
+        edges = [
+            (u, v, data["time_to_travel"])
+            for u, v, data in graph.edges(data=True)
+            if "time_to_travel" in data and u in index and v in index
+        ]
+        return cls(nodes, edges)
+
+    def __contains__(self, node) -> bool:
+        return node in self.index
+
+    def distance(self, start: int, end: int) -> float:
+        return float(self.dist[self.index[start], self.index[end]])
+
+    def distances_from(self, start: int, targets: List[int]) -> np.ndarray:
+        return self.dist[self.index[start], [self.index[t] for t in targets]]
+
+    def path(self, start: int, end: int) -> List[int] | None:
+        i, j = self.index[start], self.index[end]
+        if self.next_hop[i, j] == -1:
+            return None
+        path = [start]
+        while i != j:
+            i = self.next_hop[i, j]
+            path.append(self.nodes[i])
+        return path
@@ -0,0 +1,209 @@
+"""
+Планирование для нескольких чарджеров одной зоны: следующая парковка или шкаф
+назначается всем чарджерам за один вызов, две цели не достаются одному
+и тому же чарджеру, а одна цель не достаётся двум чарджерам.
+"""
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from GraphDB.charger import Charger
+from GraphDB.constants import CANDIDATES_LIMIT, TARGET_LEVEL
+from GraphDB.graph import Graph
+
+# Граф для поиска путей в рабочем процессе, передаётся один раз при запуске пула
+_worker_graph: Graph | None = None
+
+
+def _init_worker(graph: Graph) -> None:
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _score_in_worker(start: int, candidates: List[int], limit: int | None):
+    return score_candidates_counted(_worker_graph, start, candidates, limit)
+
+
+def score_candidates(
+    graph: Graph, start: int, candidates: List[int], limit: int | None
+) -> Dict[int, float]:
+    """
+    Время пути от start до limit ближайших по прямой кандидатов без учёта ожидания зарядки.
+    """
+    costs, expanded = score_candidates_counted(graph, start, candidates, limit)
+    graph.expanded_nodes += expanded
+    return costs
+
+
+def score_candidates_counted(
+    graph: Graph, start: int, candidates: List[int], limit: int | None
+) -> Tuple[Dict[int, float], int]:
+    """
+    То же, что score_candidates, и количество раскрытых вершин; граф не меняется.
+    """
+    candidates = [v for v in candidates if v != start]
+    if limit is not None:
+        candidates = graph.closest_candidates(candidates, start, limit)
+    return graph.path_costs_counted(start, candidates)
+
+
+def assign(scores: List[Dict[int, float]]) -> Dict[int, int]:
+    """
+    Жадное назначение по возрастанию стоимости по всем парам (номер чарджера, цель):
+    каждый чарджер получает не больше одной цели, каждая цель достаётся
+    не больше чем одному чарджеру.
+    :param scores: стоимости целей для каждого чарджера
+    :return: номер чарджера -> цель
+    """
+    pairs = sorted(
+        (cost, index, vertex)
+        for index, costs in enumerate(scores)
+        for vertex, cost in costs.items()
+    )
+    assigned: Dict[int, int] = {}
+    claimed = set()
+    for cost, index, vertex in pairs:
+        if index in assigned or vertex in claimed:
+            continue
+        assigned[index] = vertex
+        claimed.add(vertex)
+    return assigned
+
+
+class FleetPlanner:
+    """
+    Назначение целей нескольким чарджерам. Оценка кандидатов каждого чарджера
+    выполняется в пуле потоков или процессов, назначение - жадно по возрастанию
+    стоимости по всем парам (чарджер, цель): каждая парковка и каждый шкаф
+    достаются не больше чем одному чарджеру за вызов.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        workers: int | None = None,
+        processes: bool = False,
+        limit: int | None = CANDIDATES_LIMIT,
+    ):
+        """
+        :param workers: размер пула, по умолчанию количество ядер
+        :param processes: оценивать кандидатов в процессах; рабочим процессам один раз
+            передаётся копия графа для поиска путей, она обновляется при изменении рёбер PATH
+        :param limit: сколько ближайших кандидатов точно оценивается для каждого чарджера
+        """
+        self.graph = graph
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.limit = limit
+        self._executor: Executor | None = None
+        self._routing_version = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self.processes and self._routing_version != self.graph.routing_version:
+            self.close()
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.graph.routing_copy(),),
+                )
+                self._routing_version = self.graph.routing_version
+            else:
+                self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    def _score(self, requests: List[Tuple[int, List[int]]], limit: int | None):
+        executor = self._get_executor()
+        if self.processes:
+            futures = [
+                executor.submit(_score_in_worker, start, candidates, limit)
+                for start, candidates in requests
+            ]
+        else:
+            # Ленивые структуры строятся заранее, а не наперегонки в потоках
+            self.graph.get_distances()
+            self.graph.get_hierarchy()
+            self.graph.get_spatial_indexes()
+            futures = [
+                executor.submit(score_candidates_counted, self.graph, start, candidates, limit)
+                for start, candidates in requests
+            ]
+        results = [future.result() for future in futures]
+        # Потоки не меняют граф: раскрытые вершины суммируются после их завершения
+        self.graph.expanded_nodes += sum(expanded for _, expanded in results)
+        return [costs for costs, _ in results]
+
+    def plan(self, chargers: List[Charger]) -> List[Tuple[List[int], int | None, float]]:
+        """
+        Выбирает следующую вершину для каждого чарджера, ничего не меняя в графе.
+        Чарджеры с батареями едут на парковки с низким зарядом, без батарей -
+        к свободному шкафу (или к любому шкафу, если свободных нет).
+        :return: для каждого чарджера (путь, следующая вершина, стоимость);
+            ([], None, 0), если цели не нашлось или все подходящие заняты другими
+        """
+        low_level_vertices = self.graph.find_low_level_vertices(TARGET_LEVEL)
+        available_chargers = self.graph.find_available_chargers()
+        if len(available_chargers) == 0:
+            available_chargers = self.graph.get_nodes_by_type("locker")
+        requests = [
+            (
+                charger.current_location,
+                available_chargers
+                if charger.available_batteries == 0
+                else low_level_vertices,
+            )
+            for charger in chargers
+        ]
+        # Запас кандидатов на случай, если ближайшие достанутся другим чарджерам
+        limit = None if self.limit is None else self.limit + len(chargers) - 1
+        scores = self._score(requests, limit)
+
+        for charger, costs in zip(chargers, scores):
+            if charger.available_batteries == 0:
+                for vertex in costs:
+                    costs[vertex] += self.graph.charge_wait(vertex)
+        assigned = assign(scores)
+
+        plans = []
+        for index, charger in enumerate(chargers):
+            vertex = assigned.get(index)
+            result = None
+            if vertex is not None:
+                result = self.graph.dijkstra(
+                    charger.current_location, vertex, charger.available_batteries == 0
+                )
+            if result is None:
+                plans.append(([], None, 0))
+            else:
+                plans.append((result[0], vertex, result[1]))
+        return plans
+
+    def step(
+        self, chargers: List[Charger], target_level: int
+    ) -> List[Tuple[List[int], int | None, float]]:
+        """
+        Аналог Graph.charge_nearest_parking для всех чарджеров сразу:
+        планирует цели и выполняет действия чарджеров на них.
+        """
+        plans = self.plan(chargers)
+        for charger, (_, next_vertex, _) in zip(chargers, plans):
+            if next_vertex is None:
+                continue
+            if self.graph.nodes[next_vertex]["type"] == "parking":
+                charger.distribute_batteries(next_vertex, target_level)
+            else:
+                charger.refill_batteries(next_vertex)
+            charger.move_to(next_vertex)
+        return plans
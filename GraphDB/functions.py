@@ -4,9 +4,20 @@ import time
 from typing import Dict
 
 import networkx as nx
+import numpy as np
 
+from GraphDB.constants import CAN_WRITE
+from GraphDB.generator import (
+    NEIGHBOURS,
+    City,
+    connection_edges,
+    write_city,
+    write_connections,
+)
 from GraphDB.models import Parking, Locker, Scooter
 from GraphDB.graph import Graph
+from GraphDB.sync import fetch_clock
+from GraphDB.writer import WriteBehindBuffer
 from neomodel import config, db, Traversal, EITHER
 import itertools
 
@@ -18,9 +29,35 @@ def delete_all():
         i.delete()
     for i in Scooter.nodes.all():
         i.delete()
+    db.cypher_query("MATCH (d:DeletedScooter) DELETE d")
+    # Новый город начинается с нулевых часов, а версии изменений продолжают расти
+    db.cypher_query("MATCH (c:Clock) REMOVE c.value")
 
 
-def _make_connections():
+def _make_connections(
+    connections: str = "complete", k: int = NEIGHBOURS, radius: float | None = None
+):
+    """
+    Создаёт рёбра PATH между парковками и шкафами.
+    :param connections: "complete" - полный граф; "knn" - k ближайших соседей по lat/lon;
+        "radius" - соседи в радиусе radius. Разреженные графы всегда связны,
+        время пути считается по той же формуле.
+    """
+    if connections != "complete":
+        rows, _ = db.cypher_query(
+            """MATCH (n) WHERE n:Parking OR n:Locker
+               RETURN n.node_id, CASE WHEN n:Parking THEN "Parking" ELSE "Locker" END, n.lat, n.lon"""
+        )
+        if len(rows) == 0:
+            return
+        node_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        labels = np.array([row[1] for row in rows])
+        positions = np.array([[row[2], row[3]] for row in rows], dtype=np.float64)
+        u, v, times = connection_edges(
+            positions, np.random.default_rng(), connections, k, radius
+        )
+        write_connections(node_ids, labels, u, v, times)
+        return
     query = (
         "{time_to_travel: round((sqrt((l1.lat-l2.lat)^2 + (l1.lon-l2.lon)^2) / 8.5) + rand() * 1000 %"
         " sqrt((l1.lat-l2.lat)^2 + (l1.lon-l2.lon)^2) / 2.5 * 4, 2)}"
@@ -75,33 +112,91 @@ def make_static_graph() -> None:
     _make_connections()
 
 
-@db.transaction
 def make_random_graph(params: Dict) -> None:
-    """ "
-    :param params: Dictionary of parameters(parkingCount, lockerCount, scooterCount, squareSize)
     """
-    squareSize = params.get("squareSize", 1000)
-    getRandomPos = lambda: random.randint(0, squareSize)
-    for i in range(params.get("parkingCount", 20)):
-        Parking(name=f"Parking {i}", lat=getRandomPos(), lon=getRandomPos()).save()
-    for i in range(params.get("lockerCount", 10)):
-        Locker(name=f"Locker {i}", lat=getRandomPos(), lon=getRandomPos()).save()
-    for i in range(params.get("scooterCount", 15)):
-        parking = random.choice(Parking.nodes.all())
-        scooter = Scooter(
-            name=f"Scooter {i}",
-            charge=random.choices(
-                range(45, 100), weights=(100 - i * 3 for i in range(100 - 45)), k=1
-            )[0],
-            # parking=parking.node_id
+    Генерирует город массивами и записывает его в базу порциями UNWIND.
+    :param params: Dictionary of parameters(parkingCount, lockerCount, scooterCount, squareSize, seed,
+        connections, neighbours, radius)
+    """
+    write_city(City(params, seed=params.get("seed")))
+    _make_connections(
+        params.get("connections", "complete"),
+        params.get("neighbours", NEIGHBOURS),
+        params.get("radius"),
+    )
+
+
+def _new_graph() -> Graph:
+    return Graph(writer=WriteBehindBuffer() if CAN_WRITE else None)
+
+
+def _restore_clock(graph: Graph) -> None:
+    # Общие с scripts/db_update.py часы, по которым шкафам выставляется ready_at
+    graph.clock = fetch_clock()
+
+
+def read_graph(with_distances: bool = False) -> Graph:
+    """
+    Загружает граф несколькими запросами, возвращающими плоские строки,
+    вместо обхода связей каждой вершины через ORM.
+    :param with_distances: построить матрицу кратчайших времён пути между парковками и шкафами.
+        Построение занимает O(n^3) времени и O(n^2) памяти, поэтому по умолчанию выключено:
+        без матрицы маршруты ищутся по иерархии сжатия или алгоритмом Дейкстры
+    """
+    graph = _new_graph()
+    parkings, _ = db.cypher_query(
+        "MATCH (p:Parking) RETURN p.node_id, p.name, p.lat, p.lon, p.capacity"
+    )
+    for node_id, name, lat, lon, capacity in parkings:
+        graph.add_node(
+            node_id, lat=lat, lon=lon, capacity=capacity, name=name, type="parking"
         )
-        scooter.set_parking(parking.node_id)
-        parking.has_scooter.connect(scooter)
-    _make_connections()
+    scooters, _ = db.cypher_query(
+        """MATCH (p:Parking)-[:HAS_SCOOTER]->(s:Scooter)
+           RETURN s.node_id, s.name, s.charge, coalesce(s.parking, p.node_id), p.node_id,
+                  coalesce(s.updated_at, 0)"""
+    )
+    if scooters:
+        node_ids, _, charges, parkings, _, updated_at = zip(*scooters)
+        graph.add_scooters(node_ids, parkings, charges)
+        graph.scooters_synced_at = max(updated_at)
+    lockers, _ = db.cypher_query(
+        """MATCH (l:Locker)
+           RETURN l.node_id, l.name, l.lat, l.lon, l.capacity, l.status, coalesce(l.ready_at, 0.0),
+                  coalesce(l.updated_at, 0)"""
+    )
+    for row in lockers:
+        node_id, name, lat, lon, capacity, status, ready_at, updated_at = row
+        graph.add_node(
+            node_id,
+            lat=lat,
+            lon=lon,
+            capacity=capacity,
+            ready_at=ready_at,
+            status=status,
+            name=name,
+            type="locker",
+        )
+        graph.lockers_synced_at = max(graph.lockers_synced_at, updated_at)
+    _restore_clock(graph)
+    paths, _ = db.cypher_query(
+        """MATCH (a)-[r:PATH]->(b)
+           WHERE (a:Parking OR a:Locker) AND (b:Parking OR b:Locker)
+           RETURN a.node_id, b.node_id, r.time_to_travel"""
+    )
+    for source, target, time_to_travel in paths:
+        graph.add_edge(source, target, time_to_travel=time_to_travel)
+    if with_distances:
+        graph.build_distance_matrix()
+    return graph
 
 
-def read_graph() -> Graph:
-    graph = Graph()
+def read_graph_legacy(with_distances: bool = False) -> Graph:
+    """
+    Загрузка графа через ORM: по запросу на связи каждой вершины.
+    Оставлена для сравнения со read_graph (scripts/compare_loaders.py).
+    """
+    graph = _new_graph()
     for parking in Parking.nodes.all():
         graph.add_node(parking.node_id, instance=parking)
         for scooter in parking.has_scooter.all():
@@ -109,6 +204,7 @@ def read_graph() -> Graph:
             graph.add_edge(scooter.node_id, parking.node_id)
     for locker in Locker.nodes.all():
         graph.add_node(locker.node_id, instance=locker)
+    _restore_clock(graph)
     for parking in Parking.nodes.all():
         for connection in parking.parkingPath.all():
             r = parking.parkingPath.relationship(connection)
@@ -120,12 +216,14 @@ def read_graph() -> Graph:
             graph.add_edge(
                 parking.node_id, connection.node_id, time_to_travel=r.time_to_travel
             )
-    for locker in Parking.nodes.all():
+    for locker in Locker.nodes.all():
         for connection in locker.lockerPath.all():
             r = locker.lockerPath.relationship(connection)
             graph.add_edge(
                 locker.node_id, connection.node_id, time_to_travel=r.time_to_travel
             )
+    if with_distances:
+        graph.build_distance_matrix()
     return graph
 
 
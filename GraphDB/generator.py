@@ -0,0 +1,327 @@
+"""
+Пакетная генерация синтетического города. Парковки, шкафы и самокаты создаются
+массивами NumPy, после чего город либо записывается в базу порциями UNWIND,
+либо сразу превращается в граф в памяти без обращения к базе.
+"""
+import argparse
+import bisect
+import itertools
+import time
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from GraphDB.graph import Graph
+from GraphDB.spatial import sparse_edges
+
+CHUNK_SIZE = 10000
+# Количество соседей каждой вершины в разреженном графе дорог
+NEIGHBOURS = 6
+CHARGES = np.arange(45, 100)
+
+
+def _charge_probabilities() -> np.ndarray:
+    """
+    Распределение заряда новых самокатов, которое на самом деле даёт
+    random.choices(range(45, 100), weights=(100 - i * 3 ...)) в make_random_graph.
+    Часть весов там отрицательна, поэтому распределение считается по тем же
+    кумулятивным весам и той же бисекции, что и в random.choices.
+    """
+    cum_weights = list(itertools.accumulate(100 - i * 3 for i in range(len(CHARGES))))
+    total = cum_weights[-1]
+    bounds = sorted({0, total, *(w for w in cum_weights if 0 < w < total)})
+    probabilities = np.zeros(len(CHARGES))
+    for low, high in zip(bounds, bounds[1:]):
+        index = bisect.bisect(cum_weights, (low + high) / 2, 0, len(CHARGES) - 1)
+        probabilities[index] += (high - low) / total
+    return probabilities
+
+
+def travel_times(distances: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Время пути по рёбрам, та же формула, что и в _make_connections.
+    """
+    noise = np.zeros_like(distances)
+    positive = distances > 0
+    noise[positive] = (rng.random(positive.sum()) * 1000) % distances[positive]
+    return np.round(distances / 8.5 + noise / 2.5 * 4, 2)
+
+
+def connection_edges(
+    positions: np.ndarray,
+    rng: np.random.Generator,
+    connections: str = "complete",
+    k: int = NEIGHBOURS,
+    radius: float | None = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Рёбра между точками positions и время пути по ним, см. City.edges.
+    """
+    match connections:
+        case "complete":
+            u, v = np.triu_indices(len(positions), k=1)
+        case "knn":
+            u, v = sparse_edges(positions, k=k)
+        case "radius":
+            u, v = sparse_edges(positions, radius=radius)
+        case _:
+            raise ValueError(f"Unknown connections mode {connections}")
+    distances = np.hypot(*(positions[u] - positions[v]).T)
+    return u, v, travel_times(distances, rng)
+
+
+class City:
+    """
+    Синтетический город в виде массивов: координаты парковок и шкафов,
+    парковка (индекс) и заряд каждого самоката.
+    """
+
+    def __init__(self, params: Dict, seed: int | None = None):
+        """
+        :param params: Dictionary of parameters(parkingCount, lockerCount, scooterCount, squareSize)
+        """
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        square_size = params.get("squareSize", 1000)
+        parking_count = params.get("parkingCount", 20)
+        locker_count = params.get("lockerCount", 10)
+        scooter_count = params.get("scooterCount", 15)
+
+        self.parking_ids = np.arange(1, parking_count + 1, dtype=np.int64)
+        self.parking_pos = rng.integers(0, square_size + 1, size=(parking_count, 2))
+        self.locker_ids = np.arange(
+            parking_count + 1, parking_count + locker_count + 1, dtype=np.int64
+        )
+        self.locker_pos = rng.integers(0, square_size + 1, size=(locker_count, 2))
+        first_scooter = parking_count + locker_count + 1
+        self.scooter_ids = np.arange(
+            first_scooter, first_scooter + scooter_count, dtype=np.int64
+        )
+        self.scooter_parking = rng.integers(0, parking_count, size=scooter_count)
+        self.scooter_charge = rng.choice(
+            CHARGES, size=scooter_count, p=_charge_probabilities()
+        )
+
+    def positions(self) -> np.ndarray:
+        return np.vstack([self.parking_pos, self.locker_pos]).astype(np.float64)
+
+    def edges(
+        self,
+        connections: str = "complete",
+        k: int = NEIGHBOURS,
+        radius: float | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Рёбра PATH между парковками и шкафами.
+        :param connections: "complete" - полный граф, как в _make_connections (квадратичное
+            количество рёбер); "knn" - k ближайших соседей; "radius" - соседи в радиусе radius.
+            Разреженные графы всегда связны.
+        :return: индексы вершин (парковки, затем шкафы) и время пути
+        """
+        positions = self.positions()
+        return connection_edges(positions, self.rng, connections, k, radius)
+
+    def vertex_ids(self) -> np.ndarray:
+        return np.concatenate([self.parking_ids, self.locker_ids])
+
+
+def to_graph(
+    city: City,
+    connections: str | None = "complete",
+    k: int = NEIGHBOURS,
+    radius: float | None = None,
+) -> Graph:
+    """
+    Строит граф в памяти без обращения к базе.
+    :param connections: способ соединения парковок и шкафов (см. City.edges),
+        None - без рёбер PATH
+    """
+    graph = Graph()
+    for i, (node_id, (lat, lon)) in enumerate(zip(city.parking_ids, city.parking_pos)):
+        graph.add_node(
+            int(node_id),
+            lat=int(lat),
+            lon=int(lon),
+            capacity=20,
+            name=f"Parking {i}",
+            type="parking",
+        )
+    for i, (node_id, (lat, lon)) in enumerate(zip(city.locker_ids, city.locker_pos)):
+        graph.add_node(
+            int(node_id),
+            lat=int(lat),
+            lon=int(lon),
+            capacity=20,
+            ready_at=0,
+            status="0",
+            name=f"Locker {i}",
+            type="locker",
+        )
+    graph.add_scooters(
+        city.scooter_ids, city.parking_ids[city.scooter_parking], city.scooter_charge
+    )
+    if connections is not None:
+        ids = city.vertex_ids().tolist()
+        u, v, times = city.edges(connections, k, radius)
+        graph.add_edges_from(
+            (ids[a], ids[b], {"time_to_travel": t})
+            for a, b, t in zip(u.tolist(), v.tolist(), times.tolist())
+        )
+        graph.invalidate_distances()
+    return graph
+
+
+def _chunks(rows, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def write_city(city: City, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Записывает город в базу порциями по chunk_size строк, по одному запросу UNWIND на порцию.
+    Каждая порция - отдельная транзакция со своей версией изменений.
+    Рёбра PATH не создаются, для них вызывается _make_connections
+    или write_connections.
+    """
+    from neomodel import db, install_labels
+
+    from GraphDB.models import NEXT_VERSION, DeletedScooter, Locker, Parking, Scooter
+
+    for model in (Parking, Locker, Scooter, DeletedScooter):
+        install_labels(model)
+    parkings = (
+        {"node_id": node_id, "name": f"Parking {i}", "lat": lat, "lon": lon}
+        for i, (node_id, (lat, lon)) in enumerate(
+            zip(city.parking_ids.tolist(), city.parking_pos.tolist())
+        )
+    )
+    for chunk in _chunks(parkings, chunk_size):
+        db.cypher_query(
+            NEXT_VERSION
+            + """UNWIND $rows AS row
+               CREATE (:Parking {node_id: row.node_id, name: row.name, lat: row.lat,
+                                 lon: row.lon, capacity: 20, updated_at: version})""",
+            {"rows": chunk},
+        )
+    lockers = (
+        {"node_id": node_id, "name": f"Locker {i}", "lat": lat, "lon": lon}
+        for i, (node_id, (lat, lon)) in enumerate(
+            zip(city.locker_ids.tolist(), city.locker_pos.tolist())
+        )
+    )
+    for chunk in _chunks(lockers, chunk_size):
+        db.cypher_query(
+            NEXT_VERSION
+            + """UNWIND $rows AS row
+               CREATE (:Locker {node_id: row.node_id, name: row.name, lat: row.lat,
+                                lon: row.lon, capacity: 20, status: "0",
+                                ready_at: 0.0, updated_at: version})""",
+            {"rows": chunk},
+        )
+    parking_ids = city.parking_ids.tolist()
+    scooters = (
+        {
+            "node_id": node_id,
+            "name": f"Scooter {i}",
+            "charge": float(charge),
+            "parking": parking_ids[parking],
+        }
+        for i, (node_id, parking, charge) in enumerate(
+            zip(
+                city.scooter_ids.tolist(),
+                city.scooter_parking.tolist(),
+                city.scooter_charge.tolist(),
+            )
+        )
+    )
+    for chunk in _chunks(scooters, chunk_size):
+        db.cypher_query(
+            NEXT_VERSION
+            + """UNWIND $rows AS row
+               MATCH (p:Parking {node_id: row.parking})
+               CREATE (p)-[:HAS_SCOOTER]->(:Scooter {
+                   node_id: row.node_id, name: row.name, charge: row.charge,
+                   parking: row.parking, updated_at: version
+               })""",
+            {"rows": chunk},
+        )
+
+
+def write_connections(
+    node_ids: np.ndarray,
+    labels: np.ndarray,
+    u: np.ndarray,
+    v: np.ndarray,
+    times: np.ndarray,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """
+    Записывает рёбра PATH порциями UNWIND. Направление ребра то же, что
+    в _make_connections: от меньшего node_id к большему внутри одного типа
+    и от парковки к шкафу между типами.
+    :param labels: метка каждой вершины: "Parking" или "Locker"
+    """
+    from neomodel import db
+
+    groups = {}
+    for a, b, t in zip(u.tolist(), v.tolist(), times.tolist()):
+        source, target = a, b
+        if labels[a] == labels[b]:
+            if node_ids[a] > node_ids[b]:
+                source, target = b, a
+        elif labels[a] == "Locker":
+            source, target = b, a
+        groups.setdefault((labels[source], labels[target]), []).append(
+            {"source": int(node_ids[source]), "target": int(node_ids[target]), "time": t}
+        )
+    for (source_label, target_label), rows in groups.items():
+        for chunk in _chunks(rows, chunk_size):
+            db.cypher_query(
+                f"""UNWIND $rows AS row
+                    MATCH (a:{source_label} {{node_id: row.source}})
+                    MATCH (b:{target_label} {{node_id: row.target}})
+                    MERGE (a)-[r:PATH]->(b)
+                    SET r.time_to_travel = row.time""",
+                {"rows": chunk},
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетического города")
+    parser.add_argument("--parkings", type=int, default=10000)
+    parser.add_argument("--lockers", type=int, default=1000)
+    parser.add_argument("--scooters", type=int, default=1000000)
+    parser.add_argument("--square-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--graph", action="store_true", help="построить граф в памяти"
+    )
+    parser.add_argument(
+        "--connections", choices=["none", "complete", "knn", "radius"], default="knn"
+    )
+    parser.add_argument("--neighbours", type=int, default=NEIGHBOURS)
+    parser.add_argument("--radius", type=float)
+    args = parser.parse_args()
+    params = {
+        "parkingCount": args.parkings,
+        "lockerCount": args.lockers,
+        "scooterCount": args.scooters,
+        "squareSize": args.square_size,
+    }
+
+    start = time.perf_counter()
+    city = City(params, seed=args.seed)
+    print(f"Генерация массивов: {time.perf_counter() - start:.2f} с")
+    if args.graph:
+        start = time.perf_counter()
+        graph = to_graph(
+            city,
+            None if args.connections == "none" else args.connections,
+            args.neighbours,
+            args.radius,
+        )
+        print(
+            f"Граф в памяти: {len(graph.nodes)} вершин, {len(graph.edges)} рёбер "
+            f"за {time.perf_counter() - start:.2f} с"
+        )
@@ -1,163 +1,573 @@
 import heapq
+import math
 from typing import Dict, List, Tuple
 
+import numpy as np
 from networkx import Graph as BaseGraph
 
-from GraphDB.constants import CAN_WRITE, TARGET_LEVEL
-from GraphDB.models import Scooter, Locker, Parking
+from GraphDB.constants import CANDIDATES_LIMIT, TARGET_LEVEL
+from GraphDB.contraction import ContractionHierarchy
+from GraphDB.distances import DistanceMatrix
+from GraphDB.metrics import METRICS
+from GraphDB.scooters import ScooterTable
+from GraphDB.spatial import GridIndex
 
 
 class Graph(BaseGraph):
     LOW_CHARGE_ZONE = 50
     AVERAGE_CHARGER_SPEED_IN_MS = 2.5
     TYPES = {"locker", "parking", "scooter"}
+    SPATIAL_TYPES = ("parking", "locker")
 
-    def __init__(self, **kwargs):
+    def __init__(self, writer=None, **kwargs):
+        """
+        Вершинами networkx являются только парковки и шкафы. Самокаты хранятся
+        в колоночной таблице self.scooters, связь самоката с парковкой задаётся
+        его атрибутом parking, а не ребром.
+
+        :param writer: буфер записи изменений вершин в базу (WriteBehindBuffer);
+            если не задан, изменения остаются только в памяти. stage вызывается
+            до применения изменения к графу
+        """
+        self.writer = writer
+        # Индексы парковок и шкафов. Словари используются как упорядоченные множества.
+        self._nodes_by_type = {t: {} for t in Graph.SPATIAL_TYPES}
+        # Самокаты и агрегаты заряда по парковкам
+        self.scooters = ScooterTable(Graph.LOW_CHARGE_ZONE)
+        # Предпосчитанная матрица времён пути между парковками и шкафами.
+        self._use_distances = False
+        self._distances = None
+        # Иерархия сжатия для точечных запросов на больших графах
+        self._hierarchy_path = None
+        self._use_hierarchy = False
+        self._hierarchy = None
+        # Пространственные индексы парковок и шкафов, строятся при первом запросе
+        self._spatial = None
+        # Нижняя граница времени пути на единицу расстояния для эвристики A*
+        self._time_per_unit = None
+        # Увеличивается при каждом изменении рёбер PATH или положения вершин
+        self.routing_version = 0
+        # Часы симуляции в единицах time_to_travel и расписание готовности шкафов:
+        # куча (ready_at, шкаф) заряжающихся шкафов и упорядоченное множество свободных
+        self.clock = 0.0
+        self._locker_queue = []
+        self._available_lockers = {}
+        # Шкафы, состояние которых менялось с последнего take_changed_nodes
+        self._changed_lockers = set()
+        # Количество вершин, раскрытых поиском пути
+        self.expanded_nodes = 0
+        # Версии изменений базы, до которых граф синхронизирован (GraphDB.sync)
+        self.scooters_synced_at = 0
+        self.lockers_synced_at = 0
         super().__init__(**kwargs)
 
     def exclude_type(self, node_type: str | set) -> List[int]:
         if not isinstance(node_type, set):
             node_type = {node_type}
-        return [
+        nodes = [
             node
-            for node in self.nodes
-            if self.nodes[node]["type"] in Graph.TYPES.difference(node_type)
+            for t in sorted(Graph.TYPES.difference(node_type, {"scooter"}))
+            for node in self._nodes_by_type[t]
         ]
+        if "scooter" not in node_type:
+            nodes += self.scooters.all_ids().tolist()
+        return nodes
 
     def exclude_edges(self, type: str) -> List[Tuple[int, int]]:
-        return [
-            i
-            for i in self.edges
-            if i[0] in self.exclude_type(type) and i[1] in self.exclude_type(type)
-        ]
+        excluded = self._nodes_by_type.get(type, ())
+        edges = [i for i in self.edges if i[0] not in excluded and i[1] not in excluded]
+        if type == "locker":
+            rows = np.arange(len(self.scooters))
+            edges += zip(
+                self.scooters.all_ids().tolist(), self.scooters.parkings_of(rows).tolist()
+            )
+        return edges
 
     def get_node(self, node_id) -> dict:
-        return self.nodes[node_id]
+        if node_id in self._node:
+            return self.nodes[node_id]
+        return self.scooters.node(node_id)
+
+    def _index_node(self, node) -> None:
+        attrs = self.nodes[node]
+        self._nodes_by_type[attrs["type"]][node] = None
+        if attrs["type"] == "parking":
+            self.scooters.register_parking(node)
+        elif attrs["type"] == "locker":
+            self._track_locker(node, attrs)
+        if self._spatial is not None:
+            self._spatial[attrs["type"]].insert(node, attrs["lat"], attrs["lon"])
+
+    def _unindex_node(self, node) -> None:
+        attrs = self.nodes[node]
+        self._nodes_by_type[attrs["type"]].pop(node, None)
+        if attrs["type"] == "parking":
+            self.scooters.deactivate_parking(node)
+        elif attrs["type"] == "locker":
+            self._available_lockers.pop(node, None)
+        if self._spatial is not None and node in self._spatial[attrs["type"]]:
+            self._spatial[attrs["type"]].remove(node)
+
+    @staticmethod
+    def _instance_attrs(instance) -> dict:
+        # Модели и синхронизация импортируются по месту: граф и планировщики
+        # должны импортироваться без neomodel
+        from GraphDB.models import Locker, Parking, Scooter
 
-    def add_node(self, node, **attr) -> None:
-        instance = attr.get("instance", None)
         if isinstance(instance, Locker):
-            super().add_node(
-                node,
+            return dict(
                 lat=instance.lat,
                 lon=instance.lon,
                 capacity=instance.capacity,
-                time_charge_remaining=instance.time_charge_remaining,
+                ready_at=instance.ready_at,
                 status=instance.status,
                 name=instance.name,
                 type="locker",
             )
         elif isinstance(instance, Scooter):
-            super().add_node(
-                node,
+            return dict(
                 charge=instance.charge,
                 name=instance.name,
                 parking=instance.parking,
                 type="scooter",
             )
         elif isinstance(instance, Parking):
-            super().add_node(
-                node,
+            return dict(
                 lat=instance.lat,
                 lon=instance.lon,
                 capacity=instance.capacity,
                 name=instance.name,
                 type="parking",
             )
-        else:
-            raise ValueError(
-                f"Expected instance: Scooter, Locker, Parking. Given instance: {instance}"
+        raise ValueError(
+            f"Expected instance: Scooter, Locker, Parking. Given instance: {instance}"
+        )
+
+    def add_node(self, node, **attr) -> None:
+        """
+        Добавляет вершину либо по экземпляру модели (instance=...),
+        либо по готовым атрибутам, среди которых обязателен type.
+        Самокат попадает в таблицу самокатов; его имя не хранится.
+        """
+        instance = attr.pop("instance", None)
+        if instance is not None or "type" not in attr:
+            attr = self._instance_attrs(instance)
+        elif attr["type"] not in Graph.TYPES:
+            raise ValueError(f"Unknown node type {attr['type']}")
+        if attr["type"] == "scooter":
+            self.scooters.add(node, attr["parking"], attr["charge"])
+            return
+        if node in self:
+            self._unindex_node(node)
+        super().add_node(node, **attr)
+        self._index_node(node)
+
+    def add_scooters(self, ids, parkings, charges) -> None:
+        """
+        Массовое добавление новых самокатов по массивам идентификаторов, парковок и зарядов.
+        """
+        self.scooters.extend(ids, parkings, charges)
+
+    def remove_node(self, n) -> None:
+        if n not in self and n in self.scooters:
+            self.scooters.remove(n)
+            return
+        if n in self:
+            self._unindex_node(n)
+            if self._distances is not None and n in self._distances:
+                self.invalidate_distances()
+        super().remove_node(n)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr) -> None:
+        if u_of_edge in self.scooters or v_of_edge in self.scooters:
+            # Связь самоката с парковкой задаётся его атрибутом parking
+            return
+        if "time_to_travel" in attr:
+            self.invalidate_distances()
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+
+    def remove_edge(self, u, v) -> None:
+        if u in self.scooters or v in self.scooters:
+            return
+        if "time_to_travel" in self.adj.get(u, {}).get(v, {}):
+            self.invalidate_distances()
+        super().remove_edge(u, v)
+
+    def remove_nodes_from(self, nodes) -> None:
+        for n in list(nodes):
+            if n in self or n in self.scooters:
+                self.remove_node(n)
+
+    def clear(self) -> None:
+        super().clear()
+        self._nodes_by_type = {t: {} for t in Graph.SPATIAL_TYPES}
+        self.scooters = ScooterTable(Graph.LOW_CHARGE_ZONE)
+        self._locker_queue = []
+        self._available_lockers = {}
+        self._changed_lockers = set()
+        self.invalidate_distances()
+        self._spatial = None
+
+    def get_spatial_indexes(self) -> Dict[str, GridIndex]:
+        if self._spatial is None:
+            self._spatial = {
+                t: GridIndex.from_points(
+                    (n, self.nodes[n]["lat"], self.nodes[n]["lon"])
+                    for n in self._nodes_by_type[t]
+                )
+                for t in Graph.SPATIAL_TYPES
+            }
+        return self._spatial
+
+    def _spatial_index(self, node_type: str) -> GridIndex:
+        return self.get_spatial_indexes()[node_type]
+
+    def nearest_nodes(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        node_types=SPATIAL_TYPES,
+        predicate=None,
+    ) -> List[int]:
+        """
+        k ближайших к точке (lat, lon) парковок и/или шкафов по прямой.
+        """
+        found = []
+        for node_type in node_types:
+            found += self._spatial_index(node_type).nearest(lat, lon, k, predicate)
+        found.sort(key=lambda item: item[0])
+        return [node for _, node in found[:k]]
+
+    def nodes_within(
+        self, lat: float, lon: float, radius: float, node_types=SPATIAL_TYPES
+    ) -> List[int]:
+        """
+        Парковки и/или шкафы на расстоянии не больше radius от точки (lat, lon).
+        """
+        found = []
+        for node_type in node_types:
+            found += self._spatial_index(node_type).within(lat, lon, radius)
+        found.sort(key=lambda item: item[0])
+        return [node for _, node in found]
+
+    def closest_candidates(self, vertices: list, current_location: int, limit: int) -> list:
+        """
+        Оставляет limit ближайших к текущему положению вершин, сохраняя их порядок.
+        """
+        if len(vertices) <= limit:
+            return vertices
+        origin = self.nodes[current_location]
+        members = set(vertices)
+        node_types = {self.nodes[v]["type"] for v in vertices}
+        closest = set(
+            self.nearest_nodes(
+                origin["lat"], origin["lon"], limit, node_types, members.__contains__
             )
+        )
+        return [v for v in vertices if v in closest]
+
+    def build_distance_matrix(self) -> DistanceMatrix:
+        """
+        Строит матрицу кратчайших времён пути между парковками и шкафами.
+        После этого dijkstra и find_nearest_from_array отвечают по матрице,
+        а при изменении рёбер PATH матрица пересобирается при следующем запросе.
+        """
+        self._use_distances = True
+        self._distances = DistanceMatrix.from_graph(self)
+        return self._distances
+
+    def invalidate_distances(self) -> None:
+        self._distances = None
+        self._hierarchy = None
+        self._time_per_unit = None
+        self.routing_version += 1
+
+    def routing_copy(self) -> "Graph":
+        """
+        Копия графа только для поиска путей: парковки, шкафы, рёбра PATH
+        и построенные матрица и иерархия, без самокатов и записи в базу.
+        Передаётся в рабочие процессы.
+        """
+        graph = Graph()
+        for node, attrs in self.nodes(data=True):
+            graph.add_node(node, **attrs)
+        graph.add_edges_from(self.edges(data=True))
+        graph.clock = self.clock
+        graph._use_distances = self._use_distances
+        graph._distances = self.get_distances()
+        graph._use_hierarchy = self._use_hierarchy
+        graph._hierarchy_path = self._hierarchy_path
+        graph._hierarchy = self.get_hierarchy()
+        return graph
+
+    def build_contraction_hierarchy(self, path: str | None = None) -> ContractionHierarchy:
+        """
+        Строит иерархию сжатия над графом PATH для графов, слишком больших для матрицы.
+        Если задан path, иерархия загружается из файла (если построена для этого же графа)
+        или сохраняется в него. При изменении рёбер PATH иерархия пересобирается
+        при следующем запросе.
+        """
+        self._use_hierarchy = True
+        self._hierarchy_path = path
+        self._hierarchy = ContractionHierarchy.for_graph(self, path)
+        return self._hierarchy
+
+    def get_hierarchy(self) -> ContractionHierarchy | None:
+        if self._use_hierarchy and self._hierarchy is None:
+            self._hierarchy = ContractionHierarchy.for_graph(self, self._hierarchy_path)
+        return self._hierarchy
+
+    def time_per_unit(self) -> float:
+        """
+        Наименьшее отношение времени пути по ребру PATH к расстоянию по прямой
+        между его концами. Для сгенерированных рёбер оно не меньше 1 / 8.5 с точностью
+        до округления. Умноженное на расстояние до цели, даёт допустимую
+        и монотонную эвристику A*.
+        """
+        if self._time_per_unit is None:
+            ratios = [
+                data["time_to_travel"] / distance
+                for u, v, data in self.edges(data=True)
+                if "time_to_travel" in data
+                and (distance := self._straight_distance(u, v)) > 0
+            ]
+            self._time_per_unit = max(min(ratios, default=0), 0)
+        return self._time_per_unit
+
+    def _straight_distance(self, u: int, v: int) -> float:
+        a, b = self.nodes[u], self.nodes[v]
+        return math.hypot(a["lat"] - b["lat"], a["lon"] - b["lon"])
+
+    def get_distances(self) -> DistanceMatrix | None:
+        if self._use_distances and self._distances is None:
+            self._distances = DistanceMatrix.from_graph(self)
+        return self._distances
+
+    def charge_wait(self, vertex: int) -> float:
+        """
+        Сколько ещё ждать окончания зарядки шкафа; 0 для свободных шкафов и парковок.
+        """
+        node = self.nodes[vertex]
+        if node["type"] != "locker" or node["status"] != "1":
+            return 0
+        return max(node["ready_at"] - self.clock, 0)
+
+    def _track_locker(self, locker: int, attrs: dict) -> None:
+        if attrs["status"] == "0":
+            self._available_lockers[locker] = None
+        elif attrs["status"] == "1":
+            heapq.heappush(self._locker_queue, (attrs["ready_at"], locker))
+
+    def _release_lockers(self) -> None:
+        """
+        Освобождает шкафы, у которых наступило время готовности. Записи кучи,
+        устаревшие после повторной постановки шкафа на зарядку, пропускаются.
+        """
+        queue = self._locker_queue
+        while queue and queue[0][0] <= self.clock:
+            ready_at, locker = heapq.heappop(queue)
+            node = self.nodes.get(locker)
+            if (
+                node is None
+                or node["type"] != "locker"
+                or node["status"] != "1"
+                or node["ready_at"] != ready_at
+            ):
+                continue
+            self.update_node(locker, {"status": "0"})
+
+    def advance_clock(self, time_passed: float) -> None:
+        """
+        Переводит часы симуляции вперёд и освобождает шкафы, закончившие зарядку.
+        Остальные шкафы не затрагиваются.
+        """
+        self.clock += time_passed
+        self._release_lockers()
+
+    def schedule_locker(self, locker: int, duration: float) -> None:
+        """
+        Ставит шкаф на зарядку: он освободится через duration по часам симуляции.
+        """
+        self.update_node(locker, {"status": "1", "ready_at": self.clock + duration})
+
+    def take_changed_nodes(self) -> Tuple[List[int], List[int]]:
+        """
+        Вершины, изменившиеся с прошлого вызова: парковки, у которых менялись самокаты,
+        и шкафы, у которых менялось состояние или идёт зарядка (оставшееся время
+        меняется вместе с часами).
+        """
+        self._release_lockers()
+        parkings = self._nodes_by_type["parking"]
+        lockers = self._nodes_by_type["locker"]
+        changed_parkings = [p for p in self.scooters.take_changed() if p in parkings]
+        changed_lockers = self._changed_lockers | {
+            locker
+            for _, locker in self._locker_queue
+            if locker in lockers and self.nodes[locker]["status"] == "1"
+        }
+        self._changed_lockers = set()
+        return changed_parkings, [v for v in lockers if v in changed_lockers]
 
     def get_nodes_by_type(self, type: str) -> List[int]:
-        return [node for node in self.nodes if self.nodes[node]["type"] == type.lower()]
+        if type.lower() == "scooter":
+            return self.scooters.all_ids().tolist()
+        return list(self._nodes_by_type[type.lower()])
+
+    def get_scooters_on_parking(self, parking_node_id: int) -> List[int]:
+        return self.scooters.ids[self.scooters.rows_on(parking_node_id)].tolist()
+
+    def get_parking_charge(self, parking_node_id: int) -> Tuple[float, int]:
+        """
+        Средний заряд самокатов на парковке и их количество.
+        """
+        return self.scooters.parking_charge(parking_node_id)
 
     def get_average_charge_level(self) -> float:
-        scooters = self.get_nodes_by_type("scooter")
-        if len(scooters) == 0:
+        average, _ = self.scooters.zone_charge()
+        if average is None:
             return 100
-        return round(sum(self.nodes[i]["charge"] for i in scooters) / len(scooters), 2)
+        return round(average, 2)
 
     def find_available_chargers(self) -> List[int]:
-        return [
-            v
-            for v in self.get_nodes_by_type("locker")
-            if self.nodes[v]["status"] == "0"
-        ]
+        self._release_lockers()
+        return list(self._available_lockers)
 
     def get_new_info_scooters(self) -> None:
-        # visited_scooters = set()
-        for i in self.get_nodes_by_type("scooter"):
-            self.remove_edge(i, self.nodes[i]["parking"])
-            self.remove_node(i)
-        for scooter in Scooter.nodes.all():
-            self.add_node(scooter.node_id, instance=scooter)
-            self.add_edge(scooter.node_id, scooter.parking)
+        """
+        Забирает из базы только самокаты, изменённые после последней синхронизации,
+        и удалённые самокаты, и применяет изменения к графу.
+        """
+        from GraphDB.sync import fetch_scooter_changes
+
+        self.flush_writes()
+        rows, deleted, self.scooters_synced_at = fetch_scooter_changes(
+            self.scooters_synced_at
+        )
+        self.apply_scooter_changes(rows, deleted)
+
+    def apply_scooter_changes(self, rows: List[list], deleted: List[int]) -> None:
+        """
+        :param rows: строки (node_id, name, charge, parking) изменённых самокатов
+        :param deleted: идентификаторы удалённых самокатов
+        """
+        parkings = self._nodes_by_type["parking"]
+        scooters = self.scooters
+        for node_id, name, charge, parking in rows:
+            if parking in parkings:
+                scooters.add(node_id, parking, charge)
+            elif node_id in scooters:
+                scooters.remove(node_id)
+        for node_id in deleted:
+            if node_id in scooters:
+                self.remove_node(node_id)
 
     def get_new_info_lockers(self) -> None:
-        for locker in Locker.nodes.all():
-            node_id = locker.node_id
-            self.nodes[node_id]["status"] = locker.status
-            self.nodes[node_id]["time_charge_remaining"] = locker.time_charge_remaining
+        from GraphDB.sync import fetch_locker_changes
+
+        self.flush_writes()
+        rows, self.lockers_synced_at = fetch_locker_changes(self.lockers_synced_at)
+        self.apply_locker_changes(rows)
+
+    def apply_locker_changes(self, rows: List[list]) -> None:
+        """
+        :param rows: строки (node_id, status, ready_at) изменённых шкафов
+        """
+        for node_id, status, ready_at in rows:
+            if node_id in self._nodes_by_type["locker"]:
+                self._set_node_attrs(node_id, {"status": status, "ready_at": ready_at})
 
     def get_low_scooters_on_parking(
         self, parking_node_id: int, target_level: int
     ) -> List[Dict[int, Dict[str, int | str]]]:
-        scooters = [
-            {i: self.nodes[i]}
-            for _, i in self.edges(parking_node_id)
-            if self.nodes[i]["type"] == "scooter"
-        ]
-        sorted_scooters = sorted(scooters, key=lambda x: x[list(x.keys())[0]]["charge"])
-        low_scooters = list(
-            filter(
-                lambda x: x[list(x.keys())[0]]["charge"] < target_level, sorted_scooters
+        return [
+            {node_id: {"charge": charge, "parking": parking_node_id, "type": "scooter"}}
+            for node_id, charge in self.scooters.low_on_parking(
+                parking_node_id, target_level
             )
-        )
-        return low_scooters
+        ]
 
     def update_node(self, node_id: int, data: Dict[str, str | int]) -> None:
+        if self.writer is not None:
+            node_type = self.nodes[node_id]["type"] if node_id in self else "scooter"
+            self.writer.stage(node_type, node_id, data)
+        self._set_node_attrs(node_id, data)
+
+    def _set_node_attrs(self, node_id: int, data: Dict[str, str | int]) -> None:
+        if node_id not in self and node_id in self.scooters:
+            if "charge" in data:
+                self.scooters.set_charge(node_id, data["charge"])
+            if "parking" in data:
+                self.scooters.move(node_id, data["parking"])
+            return
         node = self.nodes[node_id]
+        reindex = "lat" in data or "lon" in data
+        reschedule = node["type"] == "locker" and ("status" in data or "ready_at" in data)
+        if reindex:
+            self.invalidate_distances()
+            self._unindex_node(node_id)
+        elif reschedule:
+            self._available_lockers.pop(node_id, None)
         for i in data:
             node[i] = data[i]
-        if CAN_WRITE:
-            match node["type"]:
-                case "locker":
-                    db_node = Locker.nodes.get(node_id=node_id)
-                case "scooter":
-                    try:
-                        db_node = Scooter.nodes.get(node_id=node_id)
-                    except Exception:
-                        return
-                case _:
-                    raise ValueError(f"Unknown node type {node['type']}")
-            for i in data:
-                setattr(db_node, i, data[i])
-            db_node.save()
+        if reindex:
+            self._index_node(node_id)
+        elif reschedule:
+            self._track_locker(node_id, node)
+            self._changed_lockers.add(node_id)
+
+    def set_scooter_charges(self, scooters: List[int], charges) -> None:
+        """
+        Массовое изменение заряда самокатов. Агрегаты парковок пересчитываются
+        векторно для всех изменений сразу, а не на каждый самокат.
+        """
+        ids = np.asarray(scooters, dtype=np.int64)
+        charges = np.asarray(charges, dtype=np.float64)
+        if self.writer is not None:
+            for node_id, charge in zip(ids.tolist(), charges.tolist()):
+                self.writer.stage("scooter", node_id, {"charge": charge})
+        self.scooters.set_charges(ids, charges)
+
+    def flush_writes(self) -> None:
+        """
+        Записывает в базу накопленные изменения вершин.
+        """
+        if self.writer is not None:
+            self.writer.flush()
 
     def find_low_level_vertices(self, target_level: int) -> List[int]:
-        data = []
-        for node in self.exclude_type({"scooter", "locker"}):
-            s = 0
-            count = 0
-            for _, i in self.edges(node):
-                if self.nodes[i]["type"] == "scooter":
-                    s += self.nodes[i]["charge"]
-                    count += 1
-
-            if count > 0:
-                if s / count < target_level:
-                    data.append((count, s / count, node))
-        data.sort(reverse=True)
-        data = list(map(lambda x: x[-1], data))
-        return data
+        """
+        Парковки со средним зарядом ниже целевого, по убыванию количества самокатов.
+        Ранжирование пересчитывается, только если изменились агрегаты парковок.
+        """
+        return self.scooters.low_level_parkings(target_level)
 
     def dijkstra(self, start: int, end: int, to_charge) -> Tuple[List[int], int]:
         """
         Реализация алгоритма Дейкстры для поиска кратчайшего пути.
         Учитывается как расстояние, так и время зарядки.
         """
+        distances = self.get_distances()
+        if distances is not None and start in distances and end in distances:
+            path = distances.path(start, end)
+            if path is None:
+                return None
+            distance = distances.distance(start, end)
+            if to_charge and end != start:
+                distance += self.charge_wait(end)
+            return path, distance
+        hierarchy = self.get_hierarchy()
+        if hierarchy is not None and start in hierarchy and end in hierarchy:
+            result = hierarchy.query(start, end)
+            if result is None:
+                return None
+            path, distance = result
+            if to_charge and end != start:
+                distance += self.charge_wait(end)
+            return path, distance
+
         # Инициализация
+        METRICS.count("dijkstra_runs")
         nodes = self.exclude_type("scooter")
         dist = {v: float("inf") for v in nodes}
         dist[start] = 0
@@ -178,6 +588,7 @@ class Graph(BaseGraph):
 
             if current_dist > dist[current_vertex]:
                 continue
+            self.expanded_nodes += 1
 
             for neighbor in self.neighbors(current_vertex):
                 time_to_travel = self[current_vertex][neighbor].get(
@@ -186,11 +597,7 @@ class Graph(BaseGraph):
                 if time_to_travel is not None:
                     new_dist = current_dist + time_to_travel
                     if to_charge and neighbor == end:
-                        new_dist += (
-                            self.nodes[neighbor]["time_charge_remaining"]
-                            if self.nodes[neighbor]["type"] == "locker"
-                            else 0
-                        )
+                        new_dist += self.charge_wait(neighbor)
                     if new_dist < dist[neighbor]:
                         dist[neighbor] = new_dist
                         prev[neighbor] = current_vertex
@@ -198,37 +605,243 @@ class Graph(BaseGraph):
 
         return None
 
-    def evaluate_heuristic(self, charger, target_charge):
+    def dijkstra_many(
+        self, start: int, targets: List[int], to_charge
+    ) -> Dict[int, Tuple[List[int], float]]:
+        """
+        Поиск кратчайших путей от одной вершины сразу до нескольких целей.
+        Поиск останавливается, как только все цели достигнуты.
+        Время ожидания зарядки шкафа добавляется только к конечной точке пути,
+        как и в dijkstra.
+        """
+        result, expanded = self._dijkstra_many(start, targets, to_charge)
+        self.expanded_nodes += expanded
+        return result
+
+    def _dijkstra_many(
+        self, start: int, targets: List[int], to_charge
+    ) -> Tuple[Dict[int, Tuple[List[int], float]], int]:
+        METRICS.count("dijkstra_runs")
+        remaining = set(targets)
+        dist = {start: 0}
+        prev = {start: None}
+        settled = set()
+        result = {}
+        expanded = 0
+        pq = [(0, start)]
+
+        while pq and remaining:
+            current_dist, current_vertex = heapq.heappop(pq)
+            if current_vertex in settled:
+                continue
+            settled.add(current_vertex)
+            expanded += 1
+
+            if current_vertex in remaining:
+                remaining.discard(current_vertex)
+                path = []
+                v = current_vertex
+                while v is not None:
+                    path.append(v)
+                    v = prev[v]
+                path.reverse()
+                cost = current_dist
+                if to_charge and current_vertex != start:
+                    cost += self.charge_wait(current_vertex)
+                result[current_vertex] = (path, cost)
+
+            for neighbor, edge in self.adj[current_vertex].items():
+                time_to_travel = edge.get("time_to_travel", None)
+                if time_to_travel is None:
+                    continue
+                new_dist = current_dist + time_to_travel
+                if new_dist < dist.get(neighbor, float("inf")):
+                    dist[neighbor] = new_dist
+                    prev[neighbor] = current_vertex
+                    heapq.heappush(pq, (new_dist, neighbor))
+
+        return result, expanded
+
+    def path_costs(
+        self, start: int, targets: List[int], to_charge=False
+    ) -> Dict[int, float]:
+        """
+        Кратчайшие времена пути от start до каждой из целей; недостижимые цели
+        в результат не попадают. Считаются по матрице, иерархии сжатия
+        или одним поиском Дейкстры на все цели.
+        """
+        result, expanded = self.path_costs_counted(start, targets, to_charge)
+        self.expanded_nodes += expanded
+        return result
+
+    def path_costs_counted(
+        self, start: int, targets: List[int], to_charge=False
+    ) -> Tuple[Dict[int, float], int]:
+        """
+        То же, что path_costs, и количество раскрытых поиском вершин. Граф не
+        меняется, поэтому вызовы из нескольких потоков безопасны, если матрица,
+        иерархия и пространственные индексы уже построены.
+        """
+        expanded = 0
+        targets = [v for v in targets if v != start]
+        distances = self.get_distances()
+        hierarchy = self.get_hierarchy()
+        if distances is not None and start in distances and all(
+            v in distances for v in targets
+        ):
+            costs = distances.distances_from(start, targets).tolist()
+            result = {v: c for v, c in zip(targets, costs) if c != float("inf")}
+        elif hierarchy is not None and start in hierarchy and all(
+            v in hierarchy for v in targets
+        ):
+            result = {}
+            for vertex in targets:
+                found = hierarchy.query(start, vertex)
+                if found is not None:
+                    result[vertex] = found[1]
+        else:
+            paths, expanded = self._dijkstra_many(start, targets, to_charge=False)
+            result = {v: cost for v, (_, cost) in paths.items()}
+        if to_charge:
+            for vertex in result:
+                result[vertex] += self.charge_wait(vertex)
+        return result, expanded
+
+    def astar(self, start: int, end: int, to_charge) -> Tuple[List[int], float] | None:
+        """
+        Поиск кратчайшего пути A* с эвристикой: расстояние по прямой до цели,
+        умноженное на time_per_unit. Результат совпадает с dijkstra,
+        но раскрывается меньше вершин.
+        """
+        scale = self.time_per_unit()
+        target = self.nodes[end]
+
+        def heuristic(v: int) -> float:
+            node = self.nodes[v]
+            return scale * math.hypot(
+                node["lat"] - target["lat"], node["lon"] - target["lon"]
+            )
+
+        dist = {start: 0}
+        prev = {start: None}
+        closed = set()
+        pq = [(heuristic(start), 0, start)]
+
+        while pq:
+            _, current_dist, current_vertex = heapq.heappop(pq)
+            if current_vertex in closed:
+                continue
+            closed.add(current_vertex)
+            self.expanded_nodes += 1
+
+            if current_vertex == end:
+                path = []
+                v = end
+                while v is not None:
+                    path.append(v)
+                    v = prev[v]
+                path.reverse()
+                if to_charge and end != start:
+                    current_dist += self.charge_wait(end)
+                return path, current_dist
+
+            for neighbor, edge in self.adj[current_vertex].items():
+                time_to_travel = edge.get("time_to_travel", None)
+                if time_to_travel is None:
+                    continue
+                new_dist = current_dist + time_to_travel
+                if new_dist < dist.get(neighbor, float("inf")):
+                    dist[neighbor] = new_dist
+                    prev[neighbor] = current_vertex
+                    heapq.heappush(
+                        pq, (new_dist + heuristic(neighbor), new_dist, neighbor)
+                    )
+
+        return None
+
+    def heuristic_inputs(self) -> Tuple[float, int]:
+        """
+        Общие для всех кандидатов данные эвристики: средний заряд зоны
+        и количество разряженных самокатов. Считаются один раз за итерацию.
+        """
+        average, discharged = self.scooters.zone_charge()
+        if average is None:
+            return 100, 0
+        return average, discharged
+
+    def evaluate_heuristic(self, charger, target_charge, inputs=None):
         """
         Эвристическая оценка перспективности посещения данного зарядного шкафа.
         """
-        zone_level = sum(
-            self.nodes[scooter]["charge"]
-            for scooter in self.get_nodes_by_type("scooter")
-        ) / len([n for n in self.get_nodes_by_type("scooter")])
-        discharged_scooters = [
-            n
-            for n in self.get_nodes_by_type("scooter")
-            if self.nodes[n]["charge"] < 50
-        ]
-        num_to_charge = min(len(discharged_scooters), self.nodes[charger]["capacity"])
+        zone_level, discharged = inputs if inputs is not None else self.heuristic_inputs()
+        num_to_charge = min(discharged, self.nodes[charger]["capacity"])
         distance_to_target = abs(zone_level - target_charge)
         heuristic = distance_to_target - num_to_charge
         return heuristic
 
     def find_nearest_from_array(
-        self, vertices: list, current_location: int, to_charge=False
+        self,
+        vertices: list,
+        current_location: int,
+        to_charge=False,
+        limit: int | None = CANDIDATES_LIMIT,
     ) -> Tuple[List, int, int]:
+        """
+        :param limit: точно оцениваются только limit ближайших по прямой кандидатов,
+            None - все кандидаты
+        """
         next_vertex = None
         min_distance = float("inf")
         min_path = []
         if current_location in vertices:
             vertices.remove(current_location)
-        for vertex in vertices:
-            path, distance = self.dijkstra(
-                current_location, vertex, to_charge=to_charge
+        if len(vertices) == 0:
+            return min_path, next_vertex, min_distance
+        if limit is not None:
+            vertices = self.closest_candidates(vertices, current_location, limit)
+        distances = self.get_distances()
+        if (
+            distances is not None
+            and current_location in distances
+            and all(v in distances for v in vertices)
+        ):
+            costs = distances.distances_from(current_location, vertices)
+            if to_charge:
+                costs = costs + [self.charge_wait(v) for v in vertices]
+            best = int(costs.argmin())
+            if costs[best] == float("inf"):
+                return min_path, next_vertex, min_distance
+            next_vertex = vertices[best]
+            return (
+                distances.path(current_location, next_vertex),
+                next_vertex,
+                float(costs[best]),
             )
-            heuristic = self.evaluate_heuristic(vertex, 80)
+        hierarchy = self.get_hierarchy()
+        if (
+            hierarchy is not None
+            and current_location in hierarchy
+            and all(v in hierarchy for v in vertices)
+        ):
+            for vertex in vertices:
+                result = self.dijkstra(current_location, vertex, to_charge)
+                if result is not None and result[1] < min_distance:
+                    min_path, min_distance = result
+                    next_vertex = vertex
+            return min_path, next_vertex, min_distance
+        if len(vertices) == 1:
+            # Единственная цель: точечный запрос, A* раскрывает меньше вершин
+            result = self.astar(current_location, vertices[0], to_charge)
+            if result is None:
+                return min_path, next_vertex, min_distance
+            return result[0], vertices[0], result[1]
+        paths = self.dijkstra_many(current_location, vertices, to_charge=to_charge)
+        inputs = self.heuristic_inputs()
+        for vertex in vertices:
+            if vertex not in paths:
+                continue
+            path, distance = paths[vertex]
+            heuristic = self.evaluate_heuristic(vertex, 80, inputs)
             # print(heuristic)
             if distance < min_distance:  # + heuristic: # c эвристикой 61, без эвристикой 62
                 min_distance = distance
@@ -249,12 +862,16 @@ class Graph(BaseGraph):
                 charger.current_location,
                 to_charge=True,
             )
+            if next_vertex is None:
+                return [], None, 0
 
             charger.refill_batteries(next_vertex)
         else:
             path, next_vertex, distance = self.find_nearest_from_array(
                 low_level_vertices, charger.current_location
             )
+            if next_vertex is None:
+                return [], None, 0
 
             if self.nodes[next_vertex]["type"] == "parking":
                 charger.distribute_batteries(next_vertex, target_level)
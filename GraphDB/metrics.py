@@ -0,0 +1,212 @@
+"""
+Замеры итераций планирования: длительность этапов (спаны) и счётчики
+(запуски Дейкстры, раскрытые вершины, запросы к базе). Записи последних
+итераций хранятся в кольцевом буфере. Выключенные замеры сводятся
+к проверке флага: span и tick возвращают общий пустой контекст.
+Спаны и счётчики текущей итерации хранятся отдельно для каждого потока,
+поэтому итерации, выполняющиеся параллельно в потоках сервера, не смешиваются.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Dict, List
+
+import numpy as np
+
+from GraphDB.constants import METRICS_CAPACITY, METRICS_ENABLED
+
+_DISABLED = nullcontext()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class _Tick(_Span):
+    __slots__ = ()
+
+    def __enter__(self):
+        self.metrics._start_tick()
+        return super().__enter__()
+
+    def __exit__(self, *exc) -> None:
+        super().__exit__(*exc)
+        self.metrics._finish_tick()
+
+
+class Metrics:
+    """
+    Спаны и счётчики текущей итерации и кольцевой буфер завершённых итераций.
+    Кроме буфера накапливаются суммы за всё время для текстового формата Prometheus.
+    """
+
+    def __init__(self, capacity: int = METRICS_CAPACITY, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.ticks = 0
+        self._records = deque(maxlen=capacity)
+        # Спаны и счётчики текущей итерации потока (spans, counters)
+        self._local = threading.local()
+        # Буфер итераций и суммы общие для потоков и изменяются под блокировкой
+        self._lock = threading.Lock()
+        # Суммы за всё время: спан -> [количество, секунды], счётчик -> значение
+        self._span_totals: Dict[str, List[float]] = {}
+        self._counter_totals: Dict[str, int] = {}
+
+    def span(self, name: str):
+        """
+        Контекст, время выполнения которого добавляется к спану name текущей итерации.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return _Span(self, name)
+
+    def tick(self):
+        """
+        Контекст одной итерации: по выходу спаны и счётчики итерации
+        записываются в буфер, а её общая длительность - в спан "tick".
+        """
+        if not self.enabled:
+            return _DISABLED
+        return _Tick(self, "tick")
+
+    def _current(self) -> threading.local:
+        local = self._local
+        if not hasattr(local, "spans"):
+            local.spans, local.counters = {}, {}
+        return local
+
+    def _start_tick(self) -> None:
+        local = self._local
+        local.spans, local.counters = {}, {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        spans = self._current().spans
+        spans[name] = spans.get(name, 0.0) + seconds
+        with self._lock:
+            total = self._span_totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        counters = self._current().counters
+        counters[name] = counters.get(name, 0) + value
+        with self._lock:
+            self._counter_totals[name] = self._counter_totals.get(name, 0) + value
+
+    def _finish_tick(self) -> None:
+        local = self._current()
+        spans, counters = local.spans, local.counters
+        local.spans, local.counters = {}, {}
+        with self._lock:
+            self.ticks += 1
+            self._records.append(
+                {"tick": self.ticks, "time": time.time(), "spans": spans, "counters": counters}
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.ticks = 0
+            self._records.clear()
+            self._span_totals, self._counter_totals = {}, {}
+        self._start_tick()
+
+    def records(self) -> List[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Статистика спанов по итерациям в буфере, в миллисекундах:
+        количество итераций со спаном, среднее, медиана, 95-й перцентиль и максимум.
+        Счётчики - средние за итерацию.
+        """
+        records = self.records()
+        spans: Dict[str, List[float]] = {}
+        counters: Dict[str, int] = {}
+        for record in records:
+            for name, seconds in record["spans"].items():
+                spans.setdefault(name, []).append(seconds * 1000)
+            for name, value in record["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+        result = {}
+        for name, values in spans.items():
+            values = np.array(values)
+            result[name] = {
+                "count": len(values),
+                "mean": float(values.mean()),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(values.max()),
+            }
+        ticks = max(len(records), 1)
+        result["counters"] = {name: value / ticks for name, value in counters.items()}
+        return result
+
+    def format_summary(self) -> str:
+        if not self.records():
+            return "Нет замеров" if self.enabled else "Замеры выключены"
+        summary = self.summary()
+        counters = summary.pop("counters")
+        ticks = min(self.ticks, self._records.maxlen)
+        lines = [f"{'этап':<24} {'ср., мс':>8} {'p50':>8} {'p95':>8} {'макс.':>8}"]
+        for name, row in sorted(summary.items(), key=lambda item: -item[1]["mean"]):
+            lines.append(
+                f"{name:<24} {row['mean']:>8.2f} {row['p50']:>8.2f} "
+                f"{row['p95']:>8.2f} {row['max']:>8.2f}"
+            )
+        lines.append("")
+        lines.append(f"за итерацию (последние {ticks}):")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<24} {value:>8.1f}")
+        return "\n".join(lines)
+
+    def prometheus(self, prefix: str = "graphdb") -> str:
+        """
+        Замеры в текстовом формате Prometheus: спаны - summary с квантилями
+        по буферу и суммами за всё время, счётчики - counter.
+        """
+        summary = self.summary()
+        summary.pop("counters")
+        with self._lock:
+            ticks = self.ticks
+            span_totals = {name: list(total) for name, total in self._span_totals.items()}
+            counter_totals = dict(self._counter_totals)
+        lines = [
+            f"# HELP {prefix}_ticks_total Completed planning iterations.",
+            f"# TYPE {prefix}_ticks_total counter",
+            f"{prefix}_ticks_total {ticks}",
+            f"# HELP {prefix}_span_seconds Duration of planning iteration stages.",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name, (count, seconds) in sorted(span_totals.items()):
+            row = summary.get(name)
+            if row is not None:
+                for quantile in ("p50", "p95"):
+                    lines.append(
+                        f'{prefix}_span_seconds{{span="{name}",quantile="0.{quantile[1:]}"}} '
+                        f"{row[quantile] / 1000:.6f}"
+                    )
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {count}')
+        for name, value in sorted(counter_totals.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Общие замеры процесса
+METRICS = Metrics()
@@ -1,4 +1,5 @@
 import random
+import time
 
 from neomodel import (
     StructuredNode,
@@ -10,13 +11,49 @@ from neomodel import (
     FloatProperty,
     OneOrMore,
     config,
+    db,
 )
 
 
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+# Начало запроса Cypher, выдающее следующую версию изменений в переменной version.
+# Счётчик хранится на вершине :Clock, её блокировка держится до конца транзакции,
+# поэтому транзакции с версиями фиксируются в порядке возрастания версий
+# и синхронизация по updated_at > since не пропускает изменений.
+NEXT_VERSION = """MERGE (clock:Clock)
+    SET clock.version = coalesce(clock.version, 0) + 1
+    WITH clock.version AS version
+"""
+
+
+def next_version() -> int:
+    """
+    Следующая версия изменений для записи внутри db.transaction.
+    """
+    rows, _ = db.cypher_query(NEXT_VERSION + "RETURN version")
+    return rows[0][0]
+
+
 class Base(StructuredNode):
     __abstract_node__ = True
     node_id = IntegerProperty(default=lambda: random.getrandbits(32), unique_index=True)
     name = StringProperty()
+    # Версия последнего изменения (NEXT_VERSION), по ней граф забирает только изменившиеся вершины
+    updated_at = IntegerProperty(default=0, index=True)
+
+    def post_save(self):
+        # save() не открывает транзакцию, а вложенные транзакции neomodel не поддерживает,
+        # поэтому версия выставляется отдельным запросом после записи вершины
+        rows, _ = db.cypher_query(
+            NEXT_VERSION
+            + f"""MATCH (n) WHERE {db.get_id_method()}(n) = $id
+                  SET n.updated_at = version RETURN version""",
+            {"id": self.element_id},
+        )
+        self.updated_at = rows[0][0]
 
 
 class PathRel(StructuredRel):
@@ -32,7 +69,8 @@ class Locker(Base):
     status = StringProperty(
         choices={"0": "ready", "1": "charging", "2": "empty"}, default="0"
     )
-    time_charge_remaining = IntegerProperty(default=0)
+    # Время готовности по часам симуляции (Graph.clock)
+    ready_at = FloatProperty(default=0)
     capacity = IntegerProperty(default=20)
     lockerPath = RelationshipTo("Locker", "PATH", cardinality=OneOrMore, model=PathRel)
 
@@ -57,3 +95,20 @@ class Scooter(Base):
     def set_parking(self, parking: int):
         self.parking = parking
         self.save()
+
+    def pre_delete(self):
+        db.cypher_query(
+            NEXT_VERSION
+            + """MERGE (d:DeletedScooter {node_id: $node_id})
+                 SET d.updated_at = version, d.deleted_at = $now""",
+            {"node_id": self.node_id, "now": now_ms()},
+        )
+
+
+class DeletedScooter(StructuredNode):
+    """Отметка об удалённом самокате для инкрементальной синхронизации графа."""
+
+    node_id = IntegerProperty(unique_index=True)
+    # Версия удаления для синхронизации и время удаления в мс для очистки
+    updated_at = IntegerProperty(default=0, index=True)
+    deleted_at = IntegerProperty(index=True)
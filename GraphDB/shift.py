@@ -0,0 +1,508 @@
+"""
+Планирование маршрута чарджера на всю смену вперёд вместо выбора одной
+ближайшей парковки на каждом шаге.
+
+Маршрут задаётся порядком посещения парковок; парковка может встречаться
+несколько раз, если на неё не хватает батарей за один заезд. Шкафы в маршрут
+вставляет декодер: когда батареи заканчиваются, он выбирает шкаф, заезд
+в который до следующей парковки обходится дешевле всего с учётом ожидания
+окончания зарядки. Порядок строится жадно и улучшается локальным поиском
+2-opt и or-opt в пределах бюджета времени.
+"""
+import argparse
+import time
+from typing import Dict, List, Tuple
+
+from GraphDB.charger import Charger
+from GraphDB.constants import TARGET_LEVEL, TIME_FOR_CHARGE
+from GraphDB.graph import Graph
+
+EPS = 1e-9
+
+
+class ShiftRoute:
+    """
+    Маршрут смены.
+    visits - посещения парковок (парковка, сколько самокатов на ней зарядить),
+    stops - остановки (вершина, "charge" или "refill", батарей после остановки,
+    время прибытия от начала смены), duration - длительность смены:
+    время пути и ожидания шкафов.
+    """
+
+    def __init__(
+        self,
+        start: int,
+        batteries: int,
+        visits: List[Tuple[int, int]],
+        stops: List[Tuple[int, str, int, float]],
+        duration: float,
+    ):
+        self.start = start
+        self.batteries = batteries
+        self.visits = visits
+        self.stops = stops
+        self.duration = duration
+
+
+class ShiftPlanner:
+    """
+    Планировщик маршрута смены по текущему состоянию графа: парковкам
+    со средним зарядом ниже целевого, количеству разряженных самокатов на них,
+    вместимости шкафов и времени их готовности.
+    Времена пути между остановками берутся из матрицы графа, если она построена,
+    иначе считаются поиском пути один раз для каждой новой вершины.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        time_budget: float = 1.0,
+        repair_budget: float | None = None,
+        target_level: int = TARGET_LEVEL,
+        locker_candidates: int | None = 8,
+    ):
+        """
+        :param time_budget: сколько секунд отводится на улучшение маршрута в plan
+        :param repair_budget: то же для repair, по умолчанию десятая часть time_budget
+        :param locker_candidates: сколько ближайших к парковке шкафов рассматривает декодер,
+            None - все шкафы
+        """
+        self.graph = graph
+        self.time_budget = time_budget
+        self.repair_budget = repair_budget if repair_budget is not None else time_budget / 10
+        self.target_level = target_level
+        self.locker_candidates = locker_candidates
+        # Вершины, для которых посчитаны времена пути, и симметричная таблица времён.
+        # Внутри планировщика вершины обозначаются номерами в этой таблице.
+        self._nodes: List[int] = []
+        self._index: Dict[int, int] = {}
+        self._times: List[List[float]] = []
+        self._routing_version = None
+        self._demand: Dict[int, int] = {}
+        self._lockers: List[int] = []
+        self._slot: Dict[int, int] = {}
+        self._capacity: Dict[int, int] = {}
+        self._ready: Tuple[float, ...] = ()
+        self._options: Dict[int, List[int]] = {}
+
+    # Времена пути
+
+    def _add_nodes(self, nodes: List[int]) -> None:
+        new = [v for v in dict.fromkeys(nodes) if v not in self._index]
+        if not new:
+            return
+        for vertex in new:
+            self._index[vertex] = len(self._nodes)
+            self._nodes.append(vertex)
+        size = len(self._nodes)
+        for row in self._times:
+            row.extend([float("inf")] * (size - len(row)))
+        distances = self.graph.get_distances()
+        for vertex in new:
+            i = self._index[vertex]
+            if distances is not None and all(v in distances for v in self._nodes):
+                row = distances.distances_from(vertex, self._nodes).tolist()
+            else:
+                costs = self.graph.path_costs(vertex, self._nodes)
+                row = [costs.get(v, float("inf")) for v in self._nodes]
+                row[i] = 0.0
+            self._times.append(row)
+            # Рёбра PATH неориентированные, поэтому таблица симметрична
+            for j in range(i):
+                self._times[j][i] = row[j]
+
+    def _refresh(self, start: int) -> None:
+        """
+        Перечитывает из графа спрос парковок и состояние шкафов.
+        """
+        if self._routing_version != self.graph.routing_version:
+            self._nodes, self._index, self._times = [], {}, []
+            self._routing_version = self.graph.routing_version
+        graph = self.graph
+        parkings = graph.find_low_level_vertices(self.target_level)
+        lockers = [
+            v for v in graph.get_nodes_by_type("locker") if graph.nodes[v]["capacity"] > 0
+        ]
+        self._add_nodes([start] + lockers + parkings)
+        times, index = self._times, self._index
+        self._demand = {
+            index[p]: len(graph.scooters.low_on_parking(p, self.target_level))
+            for p in parkings
+        }
+        self._lockers = [index[v] for v in lockers]
+        self._slot = {l: k for k, l in enumerate(self._lockers)}
+        self._capacity = {index[v]: graph.nodes[v]["capacity"] for v in lockers}
+        self._ready = tuple(graph.charge_wait(v) for v in lockers)
+        self._options = {
+            p: sorted(self._lockers, key=lambda l: times[l][p])[: self.locker_candidates]
+            for p in self._demand
+        }
+
+    def travel_time(self, u: int, v: int) -> float:
+        return self._times[self._index[u]][self._index[v]]
+
+    # Декодер
+
+    def _run(
+        self,
+        visits: List[Tuple[int, int]],
+        position: int,
+        state: tuple,
+        record: list | None = None,
+        stops: list | None = None,
+        best: list | None = None,
+        rejoin: int = 0,
+    ) -> float:
+        """
+        Проходит посещения, начиная с position в состоянии state
+        (время, вершина, батареи, время готовности шкафов). Если батарей
+        не хватает на посещение, перед ним делается заезд в шкаф, после которого
+        парковка достигается раньше всего.
+        :param record: сюда записываются состояния перед каждым посещением и в конце
+        :param stops: сюда записываются остановки маршрута
+        :param best: состояния текущего лучшего маршрута. Если начиная с позиции rejoin
+            состояние совпало с ним, продолжение у маршрутов одинаковое, а ожидание шкафов
+            не может сделать позднее начало раньше законченным: маршрут не лучше,
+            если пришёл в это состояние не раньше, и возвращается inf
+        :return: длительность смены или inf, если маршрут невыполним
+        """
+        times, options, capacity, slot = self._times, self._options, self._capacity, self._slot
+        elapsed, current, load, ready = state
+        n = len(visits)
+        while position < n:
+            if record is not None:
+                record.append((elapsed, current, load, ready))
+            elif best is not None and position >= rejoin:
+                other = best[position]
+                if other[1] == current and other[2] == load and other[3] == ready:
+                    if elapsed >= other[0] - EPS:
+                        return float("inf")
+                    best = None
+            parking, quantity = visits[position]
+            if load < quantity:
+                chosen, leave, arrival = None, 0.0, float("inf")
+                for locker in options[parking]:
+                    departure = max(elapsed + times[current][locker], ready[slot[locker]])
+                    if departure + times[locker][parking] < arrival:
+                        chosen, leave = locker, departure
+                        arrival = departure + times[locker][parking]
+                if chosen is None or capacity[chosen] < quantity:
+                    return float("inf")
+                elapsed = leave
+                k = slot[chosen]
+                ready = ready[:k] + (elapsed + TIME_FOR_CHARGE,) + ready[k + 1 :]
+                load = capacity[chosen]
+                current = chosen
+                if stops is not None:
+                    stops.append((self._nodes[chosen], "refill", load, elapsed))
+            travel = times[current][parking]
+            if travel == float("inf"):
+                return float("inf")
+            elapsed += travel
+            current = parking
+            load -= quantity
+            position += 1
+            if stops is not None:
+                stops.append((self._nodes[parking], "charge", load, elapsed))
+        if record is not None:
+            record.append((elapsed, current, load, ready))
+        return elapsed
+
+    def _route(self, state: tuple, batteries: int, visits: List[Tuple[int, int]]) -> ShiftRoute:
+        stops = []
+        duration = self._run(visits, 0, state, stops=stops)
+        return ShiftRoute(
+            self._nodes[state[1]],
+            batteries,
+            [(self._nodes[p], quantity) for p, quantity in visits],
+            stops,
+            duration,
+        )
+
+    # Построение
+
+    def _start(self, charger: Charger) -> Tuple[tuple, int]:
+        self._refresh(charger.current_location)
+        batteries = charger.available_batteries
+        return (0.0, self._index[charger.current_location], batteries, self._ready), batteries
+
+    def _greedy(self, state: tuple) -> Tuple[List[Tuple[int, int]], list, float]:
+        times = self._times
+        ready = dict(zip(self._lockers, self._ready))
+        remaining = {p: d for p, d in self._demand.items() if d > 0}
+        elapsed, current, load, _ = state
+        visits, stops = [], []
+        while remaining:
+            if load == 0:
+                if max(self._capacity.values(), default=0) == 0:
+                    # Пополнить батареи негде: маршрут заканчивается
+                    break
+                free = [l for l in self._lockers if ready[l] <= elapsed] or self._lockers
+                locker = min(
+                    free, key=lambda l: times[current][l] + max(ready[l] - elapsed, 0)
+                )
+                elapsed = max(elapsed + times[current][locker], ready[locker])
+                ready[locker] = elapsed + TIME_FOR_CHARGE
+                load = self._capacity[locker]
+                current = locker
+                stops.append((self._nodes[locker], "refill", load, elapsed))
+                continue
+            parking = min(remaining, key=lambda p: times[current][p])
+            if times[current][parking] == float("inf"):
+                break
+            elapsed += times[current][parking]
+            current = parking
+            served = min(load, remaining[parking])
+            load -= served
+            remaining[parking] -= served
+            if remaining[parking] == 0:
+                del remaining[parking]
+            visits.append((parking, served))
+            stops.append((self._nodes[parking], "charge", load, elapsed))
+        return visits, stops, elapsed
+
+    def greedy(self, charger: Charger) -> ShiftRoute:
+        """
+        Маршрут, который получился бы повторными вызовами charge_nearest_parking
+        на неизменном состоянии: ближайшая парковка с разряженными самокатами,
+        а без батарей - ближайший шкаф с учётом оставшегося времени зарядки.
+        """
+        state, batteries = self._start(charger)
+        visits, stops, duration = self._greedy(state)
+        return ShiftRoute(
+            charger.current_location,
+            batteries,
+            [(self._nodes[p], quantity) for p, quantity in visits],
+            stops,
+            duration,
+        )
+
+    def _pieces(self, need: int) -> List[int]:
+        """
+        Спрос парковки, разбитый на части не больше вместимости шкафа.
+        """
+        size = max(self._capacity.values(), default=0)
+        if size == 0:
+            return []
+        return [min(size, need - done) for done in range(0, need, size)]
+
+    def _nearest(self, state: tuple) -> List[Tuple[int, int]]:
+        times = self._times
+        remaining = {p for p, d in self._demand.items() if d > 0}
+        visits, current = [], state[1]
+        while remaining:
+            current = min(remaining, key=lambda p: (times[current][p], p))
+            remaining.discard(current)
+            visits += [(current, piece) for piece in self._pieces(self._demand[current])]
+        return visits
+
+    def plan(self, charger: Charger) -> ShiftRoute:
+        """
+        Маршрут смены с текущего положения и запаса батарей чарджера.
+        Начальный маршрут - лучший из жадного и маршрута по ближайшей парковке.
+        """
+        state, batteries = self._start(charger)
+        deadline = time.perf_counter() + self.time_budget
+        candidates = [self._greedy(state)[0], self._nearest(state)]
+        # Без шкафов, где можно пополнить батареи, маршруты обслуживают разный спрос:
+        # сначала сравнивается количество доставленных батарей
+        visits = min(
+            candidates, key=lambda v: (-sum(q for _, q in v), self._run(v, 0, state))
+        )
+        visits = self._improve(state, visits, deadline)
+        return self._route(state, batteries, visits)
+
+    def repair(self, route: ShiftRoute, charger: Charger) -> ShiftRoute:
+        """
+        Исправляет маршрут после изменения состояния самокатов и положения чарджера:
+        посещения уменьшаются до нового спроса, оставшийся спрос (новые парковки
+        и выросший спрос) вставляется в самое дешёвое место, после чего маршрут
+        коротко улучшается локальным поиском.
+        """
+        state, batteries = self._start(charger)
+        deadline = time.perf_counter() + self.repair_budget
+        times, index = self._times, self._index
+        left = dict(self._demand)
+        visits = []
+        for parking, quantity in route.visits:
+            p = index.get(parking)
+            served = min(quantity, left.get(p, 0))
+            if served > 0:
+                visits.append((p, served))
+                left[p] -= served
+        for parking, need in left.items():
+            for piece in self._pieces(need):
+                best, position = float("inf"), len(visits)
+                previous = state[1]
+                for i in range(len(visits) + 1):
+                    following = visits[i][0] if i < len(visits) else None
+                    delta = times[previous][parking]
+                    if following is not None:
+                        delta += times[parking][following] - times[previous][following]
+                    if delta < best:
+                        best, position = delta, i
+                    previous = following
+                visits.insert(position, (parking, piece))
+        visits = self._improve(state, visits, deadline)
+        return self._route(state, batteries, visits)
+
+    # Локальный поиск
+
+    def _improve(
+        self, state: tuple, visits: List[Tuple[int, int]], deadline: float
+    ) -> List[Tuple[int, int]]:
+        """
+        2-opt и or-opt (перенос отрезка из 1-3 посещений, в том числе развёрнутого).
+        Ход сначала проверяется по изменению времени пути без учёта шкафов,
+        затем декодируется только начиная с первого изменённого посещения.
+        """
+        times = self._times
+        states = []
+        best = self._run(visits, 0, state, record=states)
+        s = state[1]
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+
+            def accept(candidate, value):
+                nonlocal visits, best, states, improved
+                visits, best, improved = candidate, value, True
+                states = []
+                self._run(visits, 0, state, record=states)
+
+            # 2-opt: разворот отрезка visits[i..j]
+            n = len(visits)
+            for i in range(n - 1):
+                if time.perf_counter() >= deadline:
+                    return visits
+                a = visits[i - 1][0] if i > 0 else s
+                for j in range(i + 1, n):
+                    b, c = visits[i][0], visits[j][0]
+                    d = visits[j + 1][0] if j + 1 < n else None
+                    delta = times[a][c] - times[a][b]
+                    if d is not None:
+                        delta += times[b][d] - times[c][d]
+                    if delta >= -EPS:
+                        continue
+                    candidate = visits[:i] + visits[i : j + 1][::-1] + visits[j + 1 :]
+                    value = self._run(candidate, i, states[i], best=states, rejoin=j + 1)
+                    if value < best - EPS:
+                        accept(candidate, value)
+
+            # or-opt: перенос отрезка длиной 1-3
+            for length in (1, 2, 3):
+                i = 0
+                while i + length <= len(visits):
+                    if time.perf_counter() >= deadline:
+                        return visits
+                    segment = visits[i : i + length]
+                    rest = visits[:i] + visits[i + length :]
+                    first, last = segment[0][0], segment[-1][0]
+                    a = rest[i - 1][0] if i > 0 else s
+                    d = rest[i][0] if i < len(rest) else None
+                    gain = times[a][first]
+                    if d is not None:
+                        gain += times[last][d] - times[a][d]
+                    moved = False
+                    for k in range(len(rest) + 1):
+                        if k == i:
+                            continue
+                        x = rest[k - 1][0] if k > 0 else s
+                        y = rest[k][0] if k < len(rest) else None
+                        for piece, head, tail in (
+                            (segment, first, last),
+                            (segment[::-1], last, first),
+                        ):
+                            cost = times[x][head]
+                            if y is not None:
+                                cost += times[tail][y] - times[x][y]
+                            if cost - gain >= -EPS:
+                                continue
+                            candidate = rest[:k] + piece + rest[k:]
+                            begin = min(i, k)
+                            value = self._run(
+                                candidate,
+                                begin,
+                                states[begin],
+                                best=states,
+                                rejoin=max(i, k) + length,
+                            )
+                            if value < best - EPS:
+                                accept(candidate, value)
+                                moved = True
+                                break
+                        if moved:
+                            break
+                    if not moved:
+                        i += 1
+        return visits
+
+    def compare(self, charger: Charger) -> Dict:
+        """
+        Отчёт: длительность смены жадного маршрута и оптимизированного.
+        """
+        baseline = self.greedy(charger)
+        started = time.perf_counter()
+        route = self.plan(charger)
+        seconds = time.perf_counter() - started
+        return {
+            "parkings": len({parking for parking, _ in route.visits}),
+            "visits": len(route.visits),
+            "greedy": baseline.duration,
+            "optimized": route.duration,
+            "improvement": 1 - route.duration / baseline.duration
+            if baseline.duration > 0
+            else 0.0,
+            "planning_seconds": seconds,
+            "route": route,
+        }
+
+
+if __name__ == "__main__":
+    from GraphDB.generator import City, to_graph
+
+    parser = argparse.ArgumentParser(description="Маршрут чарджера на смену")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parkings", type=int, default=40)
+    parser.add_argument("--lockers", type=int, default=10)
+    parser.add_argument("--scooters", type=int, default=150)
+    parser.add_argument("--budget", type=float, default=1.0)
+    args = parser.parse_args()
+
+    city = City(
+        {
+            "parkingCount": args.parkings,
+            "lockerCount": args.lockers,
+            "scooterCount": args.scooters,
+        },
+        seed=args.seed,
+    )
+    graph = to_graph(city)
+    graph.build_distance_matrix()
+    charger = Charger(graph, graph.get_nodes_by_type("locker")[0])
+    planner = ShiftPlanner(graph, time_budget=args.budget)
+    report = planner.compare(charger)
+    print(f"Парковок в маршруте: {report['parkings']}, посещений: {report['visits']}")
+    print(f"Жадный маршрут: {report['greedy']:.2f}")
+    print(
+        f"Оптимизированный: {report['optimized']:.2f} "
+        f"({report['improvement']:.1%} короче, {report['planning_seconds']:.2f} с)"
+    )
+
+    # Изменение состояния: первые парковки маршрута обслужил кто-то другой,
+    # а на нескольких других самокаты разрядились; маршрут исправляется
+    route = report["route"]
+    served = [s for p, _ in route.visits[:5] for s in graph.get_scooters_on_parking(p)]
+    drained = [s for p, _ in route.visits[-5:] for s in graph.get_scooters_on_parking(p)]
+    graph.set_scooter_charges(served, [100] * len(served))
+    graph.set_scooter_charges(drained, [10] * len(drained))
+    started = time.perf_counter()
+    repaired = planner.repair(report["route"], charger)
+    repair_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    replanned = planner.plan(charger)
+    plan_seconds = time.perf_counter() - started
+    print(
+        f"После изменения: исправленный {repaired.duration:.2f} за {repair_seconds:.2f} с, "
+        f"заново {replanned.duration:.2f} за {plan_seconds:.2f} с"
+    )
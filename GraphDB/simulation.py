@@ -0,0 +1,170 @@
+"""
+Безголовая симуляция цикла зарядки: синхронизация, планирование, действия
+чарджера, отсчёт зарядки шкафов, разрядка и перемещение самокатов.
+Граф живёт только в памяти, ни Dash, ни база данных не используются.
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from GraphDB.charger import Charger
+from GraphDB.constants import DECREASE_PER_ITERATION, TARGET_LEVEL
+from GraphDB.fleet import FleetPlanner
+from GraphDB.generator import City, to_graph
+from GraphDB.graph import Graph
+from GraphDB.metrics import METRICS
+from GraphDB.updater import InMemoryUpdater
+from GraphDB.zones import ZonedPlanner
+
+# В отличие от Updater, удаления и появления самокатов равновероятны,
+# чтобы размер парка не уходил в ноль на длинных прогонах.
+SIMULATION_WEIGHTS = {"change_parking": 45, "remove": 30, "add": 30}
+
+
+class Simulation:
+    """
+    Прогон цикла зарядки на графе в памяти с фиксированным зерном генератора.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        seed: int | None = None,
+        start_vertex: int | None = None,
+        target_level: int = TARGET_LEVEL,
+        decrease: float = DECREASE_PER_ITERATION,
+        max_changes: int = 3,
+        idle_time: float = 10,
+        change_weights: Dict[str, int] = SIMULATION_WEIGHTS,
+        couriers: int = 1,
+        workers: int | None = None,
+        processes: bool = False,
+        zone_size: int | None = None,
+    ):
+        """
+        :param max_changes: максимальное количество случайных изменений самокатов за итерацию
+        :param idle_time: сколько времени проходит за итерацию, если чарджер стоит на месте
+        :param couriers: количество чарджеров; при нескольких цели назначает FleetPlanner,
+            а итерация длится до прибытия самого дальнего из них
+        :param workers: размер пула FleetPlanner
+        :param processes: оценивать кандидатов FleetPlanner в процессах, а не в потоках
+        :param zone_size: при нескольких чарджерах планировать по районам такого размера
+            (ZonedPlanner) вместо одного плана на весь город
+        :param change_weights: веса случайных изменений самокатов
+        """
+        self.graph = graph
+        self.rnd = random.Random(seed)
+        self.target_level = target_level
+        self.decrease = decrease
+        self.max_changes = max_changes
+        self.idle_time = idle_time
+        lockers = graph.get_nodes_by_type("locker")
+        if start_vertex is None:
+            start_vertex = lockers[0]
+        self.charger = Charger(graph, start_vertex)
+        self.chargers = [self.charger] + [
+            Charger(graph, lockers[i % len(lockers)]) for i in range(1, couriers)
+        ]
+        self.planner = None
+        if couriers > 1:
+            if zone_size is None:
+                self.planner = FleetPlanner(graph, workers, processes)
+            else:
+                self.planner = ZonedPlanner(graph, zone_size, workers, processes)
+        self.total_travel_time = 0
+        self.charge_trajectory: List[float] = []
+        self.updater = InMemoryUpdater(graph, self.rnd, change_weights)
+
+    def tick(self) -> None:
+        with METRICS.tick():
+            self._tick()
+
+    def _tick(self) -> None:
+        # Синхронизация не нужна: граф в памяти и есть источник данных
+        elapsed = self.idle_time
+        if self.graph.get_average_charge_level() < self.target_level:
+            with METRICS.span("plan"):
+                if self.planner is None:
+                    path, next_vertex, distance = self.graph.charge_nearest_parking(
+                        self.charger, self.target_level
+                    )
+                    plans = [(path, next_vertex, distance)]
+                else:
+                    plans = self.planner.step(self.chargers, self.target_level)
+            distances = [distance for _, vertex, distance in plans if vertex is not None]
+            if distances:
+                elapsed = max(distances)
+                self.total_travel_time += sum(distances)
+        with METRICS.span("update_lockers"):
+            self.updater.update_lockers(elapsed)
+        with METRICS.span("scooter_changes"):
+            self.updater.decrease_scooter_charge(self.decrease)
+            self.updater.random_change_scooters(self.max_changes)
+        self.charge_trajectory.append(self.graph.get_average_charge_level())
+
+    def run(self, ticks: int) -> Dict:
+        """
+        :return: отчёт: количество итераций в секунду, суммарное время пути чарджера
+            и заряд зоны после каждой итерации
+        """
+        start = time.perf_counter()
+        try:
+            for _ in range(ticks):
+                self.tick()
+        finally:
+            if self.planner is not None:
+                self.planner.close()
+        seconds = time.perf_counter() - start
+        return {
+            "ticks": ticks,
+            "seconds": seconds,
+            "ticks_per_second": ticks / seconds if seconds > 0 else float("inf"),
+            "total_travel_time": self.total_travel_time,
+            "charge_trajectory": self.charge_trajectory,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Безголовая симуляция зарядки")
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parkings", type=int, default=40)
+    parser.add_argument("--lockers", type=int, default=10)
+    parser.add_argument("--scooters", type=int, default=150)
+    parser.add_argument("--couriers", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--zone-size", type=int, default=None)
+    parser.add_argument("--metrics", action="store_true", help="вывести замеры этапов итерации")
+    args = parser.parse_args()
+    METRICS.enabled = args.metrics
+
+    city = City(
+        {
+            "parkingCount": args.parkings,
+            "lockerCount": args.lockers,
+            "scooterCount": args.scooters,
+        },
+        seed=args.seed,
+    )
+    graph = to_graph(city)
+    graph.build_distance_matrix()
+    report = Simulation(
+        graph,
+        seed=args.seed,
+        couriers=args.couriers,
+        workers=args.workers,
+        processes=args.processes,
+        zone_size=args.zone_size,
+    ).run(args.ticks)
+    trajectory = report["charge_trajectory"]
+    print(f"Итераций: {report['ticks']} за {report['seconds']:.2f} с")
+    print(f"Итераций в секунду: {report['ticks_per_second']:.1f}")
+    print(f"Суммарное время пути: {report['total_travel_time']:.2f}")
+    print(
+        f"Заряд зоны: начало {trajectory[0]:.2f}, минимум {min(trajectory):.2f}, "
+        f"конец {trajectory[-1]:.2f}"
+    )
+    if args.metrics:
+        print(METRICS.format_summary())
@@ -0,0 +1,209 @@
+import math
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Равномерная сетка над точками плоскости: поиск k ближайших и точек в радиусе
+    просматривает только соседние ячейки, а не все точки.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float]]] = {}
+        self.positions: Dict[Hashable, Tuple[float, float]] = {}
+        # Границы занятых ячеек; при удалении точек не сужаются
+        self._bounds = None
+
+    @classmethod
+    def from_points(
+        cls, points: Iterable[Tuple[Hashable, float, float]], per_cell: int = 4
+    ) -> "GridIndex":
+        """
+        Строит индекс с размером ячейки, при котором в ячейку в среднем попадает per_cell точек.
+        """
+        points = list(points)
+        if len(points) == 0:
+            return cls(1)
+        xs = [x for _, x, _ in points]
+        ys = [y for _, _, y in points]
+        area = max(max(xs) - min(xs), 1) * max(max(ys) - min(ys), 1)
+        index = cls(max(math.sqrt(area * per_cell / len(points)), 1))
+        for key, x, y in points:
+            index.insert(key, x, y)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, key) -> bool:
+        return key in self.positions
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, key, x: float, y: float) -> None:
+        if key in self.positions:
+            self.remove(key)
+        self.positions[key] = (x, y)
+        cx, cy = self._cell(x, y)
+        self.cells.setdefault((cx, cy), {})[key] = (x, y)
+        if self._bounds is None:
+            self._bounds = [cx, cx, cy, cy]
+        else:
+            bounds = self._bounds
+            bounds[0], bounds[1] = min(bounds[0], cx), max(bounds[1], cx)
+            bounds[2], bounds[3] = min(bounds[2], cy), max(bounds[3], cy)
+
+    def remove(self, key) -> None:
+        x, y = self.positions.pop(key)
+        cell = self._cell(x, y)
+        del self.cells[cell][key]
+        if len(self.cells[cell]) == 0:
+            del self.cells[cell]
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield cx, cy
+            return
+        for dx in range(-r, r + 1):
+            yield cx + dx, cy - r
+            yield cx + dx, cy + r
+        for dy in range(-r + 1, r):
+            yield cx - r, cy + dy
+            yield cx + r, cy + dy
+
+    def nearest(
+        self,
+        x: float,
+        y: float,
+        k: int = 1,
+        predicate: Callable[[Hashable], bool] | None = None,
+        max_distance: float | None = None,
+    ) -> List[Tuple[float, Hashable]]:
+        """
+        k ближайших точек, удовлетворяющих predicate.
+        :param max_distance: не искать дальше: точки дальше него могут не попасть в ответ
+        :return: пары (расстояние, ключ) по возрастанию расстояния
+        """
+        if k <= 0 or len(self.positions) == 0:
+            return []
+        cx, cy = self._cell(x, y)
+        found: List[Tuple[float, Hashable]] = []
+        max_ring = self._max_ring(cx, cy)
+        for r in range(max_ring + 1):
+            for cell in self._ring(cx, cy, r):
+                for key, (px, py) in self.cells.get(cell, {}).items():
+                    if predicate is None or predicate(key):
+                        found.append((math.hypot(px - x, py - y), key))
+            # Точки за пределами кольца r находятся не ближе r * cell_size
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                if found[k - 1][0] <= r * self.cell_size:
+                    return found[:k]
+            if max_distance is not None and r * self.cell_size > max_distance:
+                break
+        found.sort(key=lambda item: item[0])
+        return found[:k]
+
+    def within(self, x: float, y: float, radius: float) -> List[Tuple[float, Hashable]]:
+        """
+        Точки на расстоянии не больше radius.
+        :return: пары (расстояние, ключ) по возрастанию расстояния
+        """
+        x0, y0 = self._cell(x - radius, y - radius)
+        x1, y1 = self._cell(x + radius, y + radius)
+        found = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for key, (px, py) in self.cells.get((cx, cy), {}).items():
+                    distance = math.hypot(px - x, py - y)
+                    if distance <= radius:
+                        found.append((distance, key))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def _max_ring(self, cx: int, cy: int) -> int:
+        x0, x1, y0, y1 = self._bounds
+        return max(cx - x0, x1 - cx, cy - y0, y1 - cy, 0)
+
+
+def sparse_edges(
+    positions: np.ndarray, k: int | None = None, radius: float | None = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Рёбра разреженного графа дорог: каждая точка соединяется с k ближайшими
+    соседями и/или со всеми соседями в радиусе radius. Если граф получился
+    несвязным, компоненты соединяются кратчайшими рёбрами между ними.
+    :param positions: массив координат (n, 2)
+    :return: индексы концов рёбер u < v
+    """
+    index = GridIndex.from_points((i, x, y) for i, (x, y) in enumerate(positions.tolist()))
+    edges = set()
+    for i, (x, y) in enumerate(positions.tolist()):
+        neighbours = []
+        if k is not None:
+            neighbours += index.nearest(x, y, k + 1)
+        if radius is not None:
+            neighbours += index.within(x, y, radius)
+        for _, j in neighbours:
+            if j != i:
+                edges.add((min(i, j), max(i, j)))
+    _connect_components(index, len(positions), edges)
+    if len(edges) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    u, v = np.array(sorted(edges), dtype=np.int64).T
+    return u, v
+
+
+def _connect_components(index: GridIndex, n: int, edges: set) -> None:
+    """
+    Соединяет компоненты связности раундами: в каждом раунде каждая компонента,
+    кроме самой большой, присоединяется кратчайшим ребром к точке другой компоненты.
+    Ближайшая внешняя точка ищется через GridIndex, поэтому память не растёт
+    квадратично от размера компонент. Компонент после раунда становится
+    не больше половины, пока не останется одна.
+    """
+    parent = list(range(n))
+
+    def find(a: int) -> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for a, b in edges:
+        parent[find(a)] = find(b)
+
+    while True:
+        # Компоненты объединяются только после поиска рёбер раунда,
+        # поэтому корни на время раунда можно запомнить
+        roots = [find(i) for i in range(n)]
+        members: Dict[int, List[int]] = {}
+        for i, root in enumerate(roots):
+            members.setdefault(root, []).append(i)
+        if len(members) <= 1:
+            return
+        largest = max(members, key=lambda root: len(members[root]))
+        links = []
+        for root, points in members.items():
+            if root == largest:
+                continue
+            best = None
+            for i in points:
+                x, y = index.positions[i]
+                found = index.nearest(
+                    x,
+                    y,
+                    1,
+                    lambda key: roots[key] != root,
+                    None if best is None else best[0],
+                )
+                if found and (best is None or found[0][0] < best[0]):
+                    best = (found[0][0], i, found[0][1])
+            links.append(best)
+        for _, i, j in links:
+            edges.add((min(i, j), max(i, j)))
+            parent[find(i)] = find(j)
@@ -0,0 +1,105 @@
+from typing import List, Tuple
+
+from neomodel import db
+
+from GraphDB.metrics import METRICS
+
+# Выборка изменений идёт по индексу на updated_at (Base.updated_at), поэтому
+# условие - само свойство, без coalesce. updated_at - версия изменения
+# (GraphDB.models.NEXT_VERSION): версии фиксируются по возрастанию, поэтому
+# выборка с последней полученной версии ничего не пропускает. Вершинам старых баз
+# его проставляет scripts/backfill_updated_at.py.
+
+# Сколько мс хранятся отметки об удалении самокатов (DeletedScooter). Граф,
+# не синхронизировавшийся дольше, может не узнать об удалении и должен
+# загружаться из базы заново. Очистку выполняет scripts/db_update.py.
+TOMBSTONE_TTL = 3600 * 1000
+
+
+def fetch_scooter_changes(since: int) -> Tuple[List[list], List[int], int]:
+    """
+    Самокаты, изменённые после since, и идентификаторы удалённых самокатов.
+    :return: строки (node_id, name, charge, parking), удалённые node_id, новая версия синхронизации
+    """
+    METRICS.count("db_round_trips")
+    rows, _ = db.cypher_query(
+        """MATCH (s:Scooter) WHERE s.updated_at > $since
+           RETURN s.node_id, s.name, s.charge, s.parking, s.updated_at""",
+        {"since": since},
+    )
+    METRICS.count("db_round_trips")
+    deleted, _ = db.cypher_query(
+        """MATCH (d:DeletedScooter) WHERE d.updated_at > $since
+           RETURN d.node_id, d.updated_at""",
+        {"since": since},
+    )
+    high_water = max([since] + [row[-1] for row in rows] + [row[-1] for row in deleted])
+    return [row[:-1] for row in rows], [row[0] for row in deleted], high_water
+
+
+def fetch_locker_changes(since: int) -> Tuple[List[list], int]:
+    """
+    Шкафы, изменённые после since.
+    :return: строки (node_id, status, ready_at), новая версия синхронизации
+    """
+    METRICS.count("db_round_trips")
+    rows, _ = db.cypher_query(
+        """MATCH (l:Locker) WHERE l.updated_at > $since
+           RETURN l.node_id, l.status, coalesce(l.ready_at, 0.0), l.updated_at""",
+        {"since": since},
+    )
+    high_water = max([since] + [row[-1] for row in rows])
+    return [row[:-1] for row in rows], high_water
+
+
+def fetch_clock() -> float:
+    """
+    Часы симуляции: сохранённое значение (вершина :Clock) и не раньше последнего
+    освобождения шкафа, чтобы ready_at заряжающихся шкафов оставались осмысленными.
+    По этим часам работают и граф (read_graph), и scripts/db_update.py.
+    """
+    METRICS.count("db_round_trips")
+    rows, _ = db.cypher_query(
+        """OPTIONAL MATCH (c:Clock) WITH max(c.value) AS stored
+           OPTIONAL MATCH (l:Locker {status: "0"})
+           RETURN stored, max(l.ready_at)"""
+    )
+    stored, released = rows[0] if rows else (None, None)
+    return float(max(stored or 0.0, released or 0.0))
+
+
+def store_clock(value: float) -> None:
+    METRICS.count("db_round_trips")
+    db.cypher_query("MERGE (c:Clock) SET c.value = $value", {"value": value})
+
+
+def backfill_updated_at(labels=("Scooter", "Locker", "Parking", "DeletedScooter")) -> int:
+    """
+    Проставляет updated_at = 0 вершинам, у которых его нет (созданным до его
+    появления): без свойства вершина не попадает в выборку по индексу.
+    Так же исправляются отметки времени в мс, записанные до перехода на версии:
+    они больше любой версии, и граф, загруженный с ними, не увидел бы изменений.
+    :return: сколько вершин исправлено
+    """
+    fixed = 0
+    for label in labels:
+        rows, _ = db.cypher_query(
+            f"""OPTIONAL MATCH (c:Clock)
+                WITH coalesce(max(c.version), 0) AS current
+                MATCH (n:{label}) WHERE n.updated_at IS NULL OR n.updated_at > current
+                SET n.updated_at = 0
+                RETURN count(n)"""
+        )
+        fixed += rows[0][0]
+    return fixed
+
+
+def prune_deleted_scooters(before: int) -> None:
+    """
+    Удаляет отметки об удалении старше before (мс).
+    """
+    METRICS.count("db_round_trips")
+    db.cypher_query(
+        "MATCH (d:DeletedScooter) WHERE d.deleted_at < $before DELETE d",
+        {"before": before},
+    )
@@ -0,0 +1,121 @@
+import random
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from GraphDB.graph import Graph
+
+CHANGE_WEIGHTS = {"change_parking": 45, "remove": 35, "add": 30}
+
+
+def plan_random_changes(
+    scooters: List[Tuple[int, int]],
+    parkings: List[int],
+    rnd: random.Random,
+    new_id: Callable[[], int],
+    max_changes: int | None = None,
+    weights: Dict[str, int] = CHANGE_WEIGHTS,
+) -> Tuple[Dict[int, int], List[int], Dict[int, List]]:
+    """
+    Планирует случайные изменения самокатов: перемещения, удаления и появления.
+    :param scooters: пары (парковка, самокат)
+    :param new_id: генератор идентификаторов новых самокатов
+    :param max_changes: ограничение количества изменений, по умолчанию до количества самокатов
+    :param weights: веса действий change_parking, remove, add
+    :return: перемещения {самокат: новая парковка}, удалённые самокаты,
+        новые самокаты {самокат: [парковка, заряд]}
+    """
+    moves, removed, added = {}, [], {}
+    scooters = list(scooters)
+    if len(scooters) == 0 or len(parkings) == 0:
+        return moves, removed, added
+    upper = len(scooters) if max_changes is None else min(max_changes, len(scooters))
+    actions = rnd.choices(
+        list(weights.keys()),
+        weights=list(weights.values()),
+        k=rnd.randint(min(3, upper), upper),
+    )
+    for action in actions:
+        match action:
+            case "change_parking" if scooters:
+                index = rnd.randint(0, len(scooters) - 1)
+                scooter = scooters[index][1]
+                new_parking = rnd.choice(parkings)
+                if scooter in added:
+                    added[scooter][0] = new_parking
+                else:
+                    moves[scooter] = new_parking
+                scooters[index] = (new_parking, scooter)
+            case "remove" if scooters:
+                _, scooter = scooters.pop(rnd.randint(0, len(scooters) - 1))
+                if scooter in added:
+                    del added[scooter]
+                else:
+                    moves.pop(scooter, None)
+                    removed.append(scooter)
+            case "add":
+                scooter = new_id()
+                parking = rnd.choice(parkings)
+                added[scooter] = [parking, rnd.randint(45, 100)]
+                scooters.append((parking, scooter))
+    return moves, removed, added
+
+
+class InMemoryUpdater:
+    """
+    Реализация Updater для графа в памяти (офлайн-прогоны и симуляция).
+    Заряды самокатов меняются одной векторной операцией над массивом NumPy.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        rnd: random.Random | None = None,
+        weights: Dict[str, int] = CHANGE_WEIGHTS,
+    ):
+        self.graph = graph
+        self.rnd = rnd if rnd is not None else random.Random()
+        self.weights = weights
+        self._next_scooter_id = (
+            max(max(graph.nodes, default=0), int(graph.scooters.all_ids().max(initial=0)))
+            + 1
+        )
+
+    def _new_id(self) -> int:
+        node_id = self._next_scooter_id
+        self._next_scooter_id += 1
+        return node_id
+
+    def decrease_scooter_charge(self, percent: float) -> None:
+        scooters = self.graph.scooters
+        self.graph.set_scooter_charges(
+            scooters.all_ids().copy(), scooters.charge[: len(scooters)] - percent
+        )
+
+    def random_change_scooters(self, max_changes: int | None = None) -> None:
+        scooters = self.graph.scooters
+        pairs = zip(
+            scooters.parkings_of(np.arange(len(scooters))).tolist(),
+            scooters.all_ids().tolist(),
+        )
+        moves, removed, added = plan_random_changes(
+            pairs,
+            self.graph.get_nodes_by_type("parking"),
+            self.rnd,
+            self._new_id,
+            max_changes,
+            self.weights,
+        )
+        for scooter, parking in moves.items():
+            self.graph.update_node(scooter, {"parking": parking})
+        self.graph.remove_nodes_from(removed)
+        for scooter, (parking, charge) in added.items():
+            self.graph.add_node(
+                scooter, charge=charge, name="Scooter", parking=parking, type="scooter"
+            )
+
+    def update_lockers(self, time_passed: float) -> None:
+        """
+        :param time_passed: сколько времени прошло между вызовами функции
+        """
+        self.graph.advance_clock(time_passed)
@@ -0,0 +1,75 @@
+import time
+from typing import Dict
+
+from neomodel import db
+
+from GraphDB.constants import WRITE_BUFFER_SIZE, WRITE_FLUSH_INTERVAL
+from GraphDB.metrics import METRICS
+from GraphDB.models import next_version
+
+LABELS = {"locker": "Locker", "scooter": "Scooter"}
+
+
+class WriteBehindBuffer:
+    """
+    Буфер изменений свойств вершин. Изменения накапливаются в течение итерации
+    планирования и записываются в базу одним запросом UNWIND на каждую метку
+    в одной транзакции: явно через flush, при накоплении flush_size вершин
+    или если с последней записи прошло больше flush_interval секунд.
+    """
+
+    def __init__(
+        self,
+        flush_size: int | None = WRITE_BUFFER_SIZE,
+        flush_interval: float | None = WRITE_FLUSH_INTERVAL,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Dict[int, dict]] = {label: {} for label in LABELS.values()}
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stage(self, node_type: str, node_id: int, data: Dict[str, str | int]) -> None:
+        label = LABELS.get(node_type)
+        if label is None:
+            raise ValueError(f"Unknown node type {node_type}")
+        props = self._pending[label].get(node_id)
+        if props is None:
+            props = self._pending[label][node_id] = {}
+            self._size += 1
+        props.update(data)
+        if self.flush_size is not None and self._size >= self.flush_size:
+            self.flush()
+        elif (
+            self.flush_interval is not None
+            and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if self._size == 0:
+            return
+        # При ошибке записи изменения остаются в буфере до следующей попытки
+        self._write(self._pending)
+        self._pending = {label: {} for label in LABELS.values()}
+        self._size = 0
+
+    @db.transaction
+    def _write(self, pending: Dict[str, Dict[int, dict]]) -> None:
+        METRICS.count("db_round_trips")
+        version = next_version()
+        for label, nodes in pending.items():
+            if len(nodes) == 0:
+                continue
+            rows = [{"node_id": node_id, "props": props} for node_id, props in nodes.items()]
+            METRICS.count("db_round_trips")
+            db.cypher_query(
+                f"""UNWIND $rows AS row
+                    MATCH (n:{label} {{node_id: row.node_id}})
+                    SET n += row.props, n.updated_at = $version""",
+                {"rows": rows, "version": version},
+            )
@@ -0,0 +1,372 @@
+"""
+Планирование по районам: город делится сеткой по lat/lon, у каждого района
+свой подграф (небольшие - с матрицей времён пути). Цели внутри района назначаются независимо
+от других районов в пуле процессов, поэтому стоимость планирования района
+не растёт вместе с городом. Чарджеры, которым в своём районе цели не нашлось,
+переезжают в другой район по агрегатам районов.
+"""
+import math
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from GraphDB.charger import Charger
+from GraphDB.constants import CANDIDATES_LIMIT, TARGET_LEVEL
+from GraphDB.fleet import assign, score_candidates
+from GraphDB.graph import Graph
+from GraphDB.spatial import GridIndex
+
+Cell = Tuple[int, int]
+
+MATRIX_LIMIT = 300
+
+# Подграфы районов в рабочем процессе, передаются один раз при запуске пула
+_worker_zones: Dict[Cell, Graph] | None = None
+
+
+def _init_worker(zones: Dict[Cell, Graph]) -> None:
+    global _worker_zones
+    _worker_zones = zones
+
+
+def _plan_in_worker(cell: Cell, requests, waits, limit):
+    return plan_zone(_worker_zones[cell], requests, waits, limit)
+
+
+def plan_zone(
+    graph: Graph,
+    requests: List[Tuple[int, List[int]]],
+    waits: Dict[int, float],
+    limit: int | None,
+) -> List[Tuple[List[int], int | None, float]]:
+    """
+    Назначение целей чарджерам одного района по его подграфу.
+    :param requests: для каждого чарджера (текущая вершина, кандидаты)
+    :param waits: оставшееся время зарядки шкафов района; подграф
+        состояния шкафов не хранит
+    :return: для каждого чарджера (путь, цель, стоимость) или ([], None, 0)
+    """
+    scores = [score_candidates(graph, start, candidates, limit) for start, candidates in requests]
+    for costs in scores:
+        for vertex in costs:
+            costs[vertex] += waits.get(vertex, 0)
+    assigned = assign(scores)
+    plans = []
+    for index, (start, _) in enumerate(requests):
+        vertex = assigned.get(index)
+        result = None if vertex is None else graph.dijkstra(start, vertex, False)
+        if result is None:
+            plans.append(([], None, 0))
+        else:
+            plans.append((result[0], vertex, result[1] + waits.get(vertex, 0)))
+    return plans
+
+
+class Zone:
+    """
+    Район: его парковки и шкафы, слоты его парковок в таблице самокатов
+    и подграф для поиска путей. В подграф входят и вершины соседних районов,
+    чтобы пути между вершинами района могли проходить через соседей.
+    """
+
+    def __init__(self, cell: Cell, vertices: List[int], graph: Graph, slots: np.ndarray):
+        self.cell = cell
+        self.vertices = vertices
+        self.graph = graph
+        self.slots = slots
+        self.lockers = [v for v in vertices if graph.nodes[v]["type"] == "locker"]
+        self.center = (
+            sum(graph.nodes[v]["lat"] for v in vertices) / len(vertices),
+            sum(graph.nodes[v]["lon"] for v in vertices) / len(vertices),
+        )
+
+
+class ZonePartition:
+    """
+    Деление парковок и шкафов графа на районы по ячейкам равномерной сетки.
+    """
+
+    def __init__(
+        self, graph: Graph, zone_size: int, halo: bool = True, matrix_limit: int = MATRIX_LIMIT
+    ):
+        """
+        :param zone_size: сколько парковок и шкафов в среднем попадает в район
+        :param halo: включать в подграф района вершины соседних районов
+        :param matrix_limit: для подграфов не больше этого размера строится своя матрица
+            времён пути (Флойд-Уоршелл кубичен), для остальных пути ищутся Дейкстрой.
+            Если матрица уже построена для всего графа, подграфы отвечают по ней
+        """
+        self.graph = graph
+        grid = GridIndex.from_points(
+            (
+                (n, graph.nodes[n]["lat"], graph.nodes[n]["lon"])
+                for n in graph.exclude_type("scooter")
+            ),
+            per_cell=zone_size,
+        )
+        self.zone_of: Dict[int, Cell] = {}
+        for cell, members in grid.cells.items():
+            for vertex in members:
+                self.zone_of[vertex] = cell
+
+        table = graph.scooters
+        distances = graph.get_distances()
+        self.cells: List[Cell] = sorted(grid.cells)
+        self.number = {cell: i for i, cell in enumerate(self.cells)}
+        # Номер района для каждого слота парковки в таблице самокатов
+        self.slot_zone = np.full(max(table.slots, 1), -1, dtype=np.int64)
+        self.zones: Dict[Cell, Zone] = {}
+        for cell in self.cells:
+            vertices = sorted(grid.cells[cell])
+            routing = set(vertices)
+            if halo:
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        routing.update(grid.cells.get((cell[0] + dx, cell[1] + dy), ()))
+            subgraph = Graph()
+            for vertex in sorted(routing):
+                subgraph.add_node(vertex, **graph.nodes[vertex])
+            if distances is not None:
+                # Подграф района ссылается на матрицу всего города, а не на свой срез:
+                # next_hop в ней - номера вершин города, и пути по срезу восстановить
+                # нельзя. Поэтому пути района могут проходить через вершины других
+                # районов, а матрица при изменении графа города устаревает вместе
+                # с делением на районы (ZonedPlanner.get_partition пересобирает его).
+                # При передаче в рабочие процессы матрица сериализуется один раз
+                # для всех районов: pickle сохраняет общие ссылки.
+                subgraph._use_distances = True
+                subgraph._distances = distances
+            else:
+                subgraph.add_edges_from(
+                    (u, v, data)
+                    for u in routing
+                    for v, data in graph.adj[u].items()
+                    if v in routing and "time_to_travel" in data
+                )
+                if len(subgraph) <= matrix_limit:
+                    subgraph.build_distance_matrix()
+            slots = np.array(
+                [
+                    table.parking_slots[v]
+                    for v in vertices
+                    if graph.nodes[v]["type"] == "parking" and v in table.parking_slots
+                ],
+                dtype=np.int64,
+            )
+            self.slot_zone[slots] = self.number[cell]
+            self.zones[cell] = Zone(cell, vertices, subgraph, slots)
+
+    def stats(self, target_level: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Агрегаты районов в порядке self.cells: количество самокатов,
+        средний заряд (100 для районов без самокатов) и количество парковок
+        с зарядом ниже target_level.
+        """
+        count, charge_sum, low = self.graph.scooters.group_charge(
+            self.slot_zone, len(self.cells), target_level
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            average = np.where(count > 0, charge_sum / count, 100.0)
+        return count, average, low
+
+
+class ZonedPlanner:
+    """
+    Назначение целей нескольким чарджерам по районам. Чарджеры группируются
+    по району своей вершины; каждый район планируется отдельно (тем же жадным
+    назначением, что в FleetPlanner, по подграфу района) в пуле процессов или потоков. Чарджер без цели в своём районе
+    едет в ближайший по прямой район, где остались не занятые парковки с низким зарядом,
+    а без батарей - к ближайшему свободному шкафу города.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        zone_size: int = 100,
+        workers: int | None = None,
+        processes: bool = True,
+        limit: int | None = CANDIDATES_LIMIT,
+        halo: bool = True,
+    ):
+        """
+        :param zone_size: сколько парковок и шкафов в среднем попадает в район
+        :param workers: размер пула, по умолчанию количество ядер
+        :param processes: планировать районы в процессах; рабочим процессам один раз
+            передаются подграфы районов, они пересобираются при изменении графа
+        :param limit: сколько ближайших кандидатов точно оценивается для каждого чарджера
+        :param halo: включать в подграф района вершины соседних районов
+        """
+        self.graph = graph
+        self.zone_size = zone_size
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.limit = limit
+        self.halo = halo
+        self.partition: ZonePartition | None = None
+        self._version = None
+        self._executor: Executor | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def get_partition(self) -> ZonePartition:
+        """
+        Деление на районы; пересобирается при изменении рёбер PATH или набора вершин.
+        """
+        version = (self.graph.routing_version, self.graph.number_of_nodes())
+        if self.partition is None or self._version != version:
+            self.close()
+            self.partition = ZonePartition(self.graph, self.zone_size, self.halo)
+            self._version = version
+        return self.partition
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    initializer=_init_worker,
+                    initargs=({c: z.graph for c, z in self.partition.zones.items()},),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    def _zone_request(
+        self, zone: Zone, chargers: List[Charger], target_level: float, available: set
+    ) -> Tuple[List[Tuple[int, List[int]]], Dict[int, float]]:
+        """
+        :param available: свободные шкафы города, считаются один раз на план
+        """
+        graph = self.graph
+        low_level_vertices = graph.scooters.low_level_among(zone.slots, target_level)
+        lockers = [v for v in zone.lockers if v in available] or zone.lockers
+        requests = [
+            (
+                charger.current_location,
+                lockers if charger.available_batteries == 0 else low_level_vertices,
+            )
+            for charger in chargers
+        ]
+        return requests, {v: graph.charge_wait(v) for v in zone.lockers}
+
+    def plan(
+        self, chargers: List[Charger], target_level: float = TARGET_LEVEL
+    ) -> List[Tuple[List[int], int | None, float]]:
+        """
+        Выбирает следующую вершину для каждого чарджера, ничего не меняя в графе.
+        :param target_level: парковки с зарядом ниже него считаются целями
+        :return: для каждого чарджера (путь, следующая вершина, стоимость);
+            ([], None, 0), если цели не нашлось
+        """
+        partition = self.get_partition()
+        by_zone: Dict[Cell, List[int]] = {}
+        for index, charger in enumerate(chargers):
+            by_zone.setdefault(partition.zone_of[charger.current_location], []).append(index)
+
+        available = set(self.graph.find_available_chargers())
+        # Запас кандидатов на случай, если ближайшие достанутся другим чарджерам района
+        jobs = []
+        for cell, indices in by_zone.items():
+            requests, waits = self._zone_request(
+                partition.zones[cell], [chargers[i] for i in indices], target_level, available
+            )
+            limit = None if self.limit is None else self.limit + len(indices) - 1
+            jobs.append((cell, indices, requests, waits, limit))
+        executor = self._get_executor()
+        if self.processes:
+            futures = [
+                executor.submit(_plan_in_worker, cell, requests, waits, limit)
+                for cell, _, requests, waits, limit in jobs
+            ]
+        else:
+            futures = [
+                executor.submit(plan_zone, partition.zones[cell].graph, requests, waits, limit)
+                for cell, _, requests, waits, limit in jobs
+            ]
+
+        plans: List[Tuple[List[int], int | None, float]] = [([], None, 0)] * len(chargers)
+        for (_, indices, _, _, _), future in zip(jobs, futures):
+            for index, plan in zip(indices, future.result()):
+                plans[index] = plan
+
+        claimed = {vertex for _, vertex, _ in plans if vertex is not None}
+        for index, charger in enumerate(chargers):
+            if plans[index][1] is None:
+                plans[index] = self._cross_zone(charger, claimed, target_level, available)
+        return plans
+
+    def _cross_zone(
+        self, charger: Charger, claimed: set, target_level: float, available: set
+    ) -> Tuple[List[int], int | None, float]:
+        """
+        Переезд в другой район на уровне агрегатов районов.
+        """
+        graph, partition = self.graph, self.partition
+        origin = graph.nodes[charger.current_location]
+        if charger.available_batteries == 0:
+            for predicate in (
+                lambda v: v in available and v not in claimed,
+                lambda v: v not in claimed,
+            ):
+                found = graph.nearest_nodes(origin["lat"], origin["lon"], 1, ("locker",), predicate)
+                if found:
+                    break
+        else:
+            _, _, low = partition.stats(target_level)
+            zones = sorted(
+                (
+                    math.dist((origin["lat"], origin["lon"]), zone.center),
+                    zone.cell,
+                )
+                for zone, count in zip(
+                    (partition.zones[cell] for cell in partition.cells), low.tolist()
+                )
+                if count > 0
+            )
+            found = []
+            for _, cell in zones:
+                zone = partition.zones[cell]
+                found = [
+                    v
+                    for v in graph.scooters.low_level_among(zone.slots, target_level)
+                    if v not in claimed and v != charger.current_location
+                ]
+                if found:
+                    found = graph.closest_candidates(found, charger.current_location, 1)
+                    break
+        if not found:
+            return [], None, 0
+        vertex = found[0]
+        result = graph.dijkstra(charger.current_location, vertex, charger.available_batteries == 0)
+        if result is None:
+            return [], None, 0
+        claimed.add(vertex)
+        return result[0], vertex, result[1]
+
+    def step(
+        self, chargers: List[Charger], target_level: int
+    ) -> List[Tuple[List[int], int | None, float]]:
+        """
+        Планирует цели по районам и выполняет действия чарджеров на них.
+        """
+        plans = self.plan(chargers, target_level)
+        for charger, (_, next_vertex, _) in zip(chargers, plans):
+            if next_vertex is None:
+                continue
+            if self.graph.nodes[next_vertex]["type"] == "parking":
+                charger.distribute_batteries(next_vertex, target_level)
+            else:
+                charger.refill_batteries(next_vertex)
+            charger.move_to(next_vertex)
+        return plans
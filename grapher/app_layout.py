@@ -1,178 +1,287 @@
 import json
+import os
+import uuid
 from textwrap import dedent as d
 
 import dash
 import dash_cytoscape as cyto
 
-from dash import dcc, html
+from dash import Input, Output, callback, dcc, html
+from flask import Response
 
-from grapher.config import graph, DEFAULT_JSON, nodes_stylesheet
-from grapher.misc import make_graph
+from GraphDB.metrics import METRICS
+from grapher.clusters import render
+from grapher.config import DEFAULT_JSON, nodes_stylesheet, sessions, template
 from grapher.callbacks import (
     displayHoverNodeData,
     on_button_click,
     validate_json_output,
     submit_json,
+    show_diagnostics,
+    expand_cluster,
+    change_viewport,
 )
 
-# Создаем Dash приложение
+external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
-nodes = make_graph(graph)
 
-external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-app.title = "Граф города"
-
-app.layout = html.Div(
-    [
-        html.Div(
-            [html.H1("Граф заряда зоны")],
-            className="row",
-            style={"textAlign": "center"},
-        ),
-        html.Div(
-            className="row",
-            children=[
-                html.Div(
-                    className="three columns",
-                    children=[
-                        dcc.Markdown(
-                            d(
+def serve_layout():
+    # Пока граф загружается, отдаётся состояние загрузки, которое
+    # опрашивает сервер и заменяется схемой, когда граф готов
+    ready = template.ready()
+    return html.Div(
+        [
+            dcc.Interval(id="loading_interval", interval=1000, disabled=ready),
+            html.Div(
+                id="app_root",
+                children=main_layout() if ready else loading_layout(template.error),
+            ),
+        ]
+    )
+
+
+def loading_layout(error: Exception | None = None):
+    message = "Загрузка графа города..."
+    if error is not None:
+        message = f"Не удалось загрузить граф: {error}. Повторная попытка..."
+    return html.Div(
+        [html.H1("Граф заряда зоны"), html.P(message)],
+        className="row",
+        style={"textAlign": "center"},
+    )
+
+
+def main_layout():
+    # Разметка строится на каждую загрузку страницы: у каждой вкладки своя сессия
+    session_id = str(uuid.uuid4())
+    with sessions.session(session_id) as session:
+        elements, session.rendered = render(session.graph)
+    return html.Div(
+        [
+            dcc.Store(id="session_id", data=session_id),
+            html.Div(
+                [html.H1("Граф заряда зоны")],
+                className="row",
+                style={"textAlign": "center"},
+            ),
+            html.Div(
+                className="row",
+                children=[
+                    html.Div(
+                        className="three columns",
+                        children=[
+                            dcc.Markdown(
+                                d(
+                                    """
+                                **Кнопки перемещения к следующей точке**\n
+                                Кнопка "Дальше" для перехода к следующей итерации зарядки
+                                """
+                                )
+                            ),
+                            html.Div(
+                                className="twelve columns",
+                                children=[
+                                    html.Button("Дальше", id="next_button"),
+                                    html.Br(),
+                                ],
+                                style={"height": "200px"},
+                            ),
+                            html.Div(
+                                className="twelve columns",
+                                children=[
+                                    dcc.Markdown(
+                                        d(
+                                            """
+                                **Сгенерировать граф**\n
+                                Введите данные для генерации графа.
+                                """
+                                        )
+                                    ),
+                                    dcc.Textarea(
+                                        id="json-input",
+                                        value=json.dumps(DEFAULT_JSON, indent=4),
+                                        style={
+                                            "width": "100%",
+                                            "height": "150px",
+                                            "resize": "none",
+                                        },
+                                    ),
+                                    html.Div(id="json-output", style={"color": "red"}),
+                                    html.Button(
+                                        "Сгенерировать",
+                                        id="textarea-submit-button",
+                                        disabled=False,
+                                        n_clicks=0,
+                                    ),
+                                ],
+                                style={"height": "300px"},
+                            ),
+                        ],
+                    ),
+                    html.Div(
+                        className="five columns",
+                        children=[
+                            cyto.Cytoscape(
+                                id="city_graph",
+                                layout={"name": "preset"},
+                                className="twelve columns",
+                                style={"height": "550px"},
+                                elements=elements,
+                                stylesheet=nodes_stylesheet,
+                            ),
+                            html.Pre(
+                                className="twelve columns",
+                                id="graph_output",
+                                style={"textAlign": "center"},
+                            ),
+                        ],
+                    ),
+                    html.Div(
+                        className="three columns",
+                        children=[
+                            html.Div(
+                                className="twelve columns",
+                                children=[
+                                    dcc.Markdown(
+                                        d(
+                                            """
+                                **Данные вершин**\n
+                                При нажатии на вершину ниже будут показаны данные вершины.
                                 """
-                            **Кнопки перемещения к следующей точке**\n
-                            Кнопка "Дальше" для перехода к следующей итерации зарядки
-                            """
-                            )
-                        ),
-                        html.Div(
-                            className="twelve columns",
-                            children=[
-                                html.Button("Дальше", id="next_button"),
-                                html.Br(),
-                            ],
-                            style={"height": "200px"},
-                        ),
-                        html.Div(
-                            className="twelve columns",
-                            children=[
-                                dcc.Markdown(
-                                    d(
-                                        """
-                            **Сгенерировать граф**\n
-                            Введите данные для генерации графа.
-                            """
-                                    )
-                                ),
-                                dcc.Textarea(
-                                    id="json-input",
-                                    value=json.dumps(DEFAULT_JSON, indent=4),
-                                    style={
-                                        "width": "100%",
-                                        "height": "150px",
-                                        "resize": "none",
-                                    },
-                                ),
-                                html.Div(id="json-output", style={"color": "red"}),
-                                html.Button(
-                                    "Сгенерировать",
-                                    id="textarea-submit-button",
-                                    disabled=False,
-                                    n_clicks=0,
-                                ),
-                            ],
-                            style={"height": "300px"},
-                        ),
-                    ],
-                ),
-                html.Div(
-                    className="five columns",
-                    children=[
-                        cyto.Cytoscape(
-                            id="city_graph",
-                            layout={"name": "preset"},
-                            className="twelve columns",
-                            style={"height": "550px"},
-                            elements=nodes,
-                            stylesheet=nodes_stylesheet,
-                        ),
-                        html.Pre(
-                            className="twelve columns",
-                            id="graph_output",
-                            style={"textAlign": "center"},
-                        ),
-                    ],
-                ),
-                html.Div(
-                    className="three columns",
-                    children=[
-                        html.Div(
-                            className="twelve columns",
-                            children=[
-                                dcc.Markdown(
-                                    d(
-                                        """
-                            **Данные вершин**\n
-                            При нажатии на вершину ниже будут показаны данные вершины.
-                            """
-                                    )
-                                ),
-                                html.Pre(
-                                    id="hover_data",
-                                    style={
-                                        "height": "300px",
-                                        "overflowY": "auto",
-                                        "width": "300px",
-                                        "padding": "10px",
-                                        "backgroundColor": "white",
-                                        "border": "1px solid #ccc",
-                                        "boxShadow": "0 2px 4px rgba(0, 0, 0, 0.1)",
-                                    },
-                                ),
-                                html.Br(),
-                                html.Div(
-                                    className="twelve columns",
-                                    style={
-                                        "display": "flex",
-                                        "alignItems": "center",
-                                        "justifyContent": "space-between",
-                                    },
-                                    children=[
-                                        html.P(
-                                            "Заряд зоны: ",
-                                            style={"fontWeight": "bold"},
-                                        ),
-                                        html.P(
-                                            id="charge_data",
-                                        ),
-                                    ],
-                                ),
-                                html.Div(
-                                    className="twelve columns",
-                                    style={
-                                        "display": "flex",
-                                        "alignItems": "center",
-                                        "justifyContent": "space-between",
-                                    },
-                                    children=[
-                                        html.P(
-                                            "Количество батарей у чарджера: ",
-                                            style={"fontWeight": "bold"},
-                                        ),
-                                        html.P(
-                                            id="batteries_count",
-                                        ),
-                                    ],
-                                ),
-                            ],
-                            style={"height": "400px"},
-                        ),
-                    ],
-                ),
-            ],
-        ),
-    ]
+                                        )
+                                    ),
+                                    html.Pre(
+                                        id="hover_data",
+                                        style={
+                                            "height": "300px",
+                                            "overflowY": "auto",
+                                            "width": "300px",
+                                            "padding": "10px",
+                                            "backgroundColor": "white",
+                                            "border": "1px solid #ccc",
+                                            "boxShadow": "0 2px 4px rgba(0, 0, 0, 0.1)",
+                                        },
+                                    ),
+                                    html.Br(),
+                                    html.Div(
+                                        className="twelve columns",
+                                        style={
+                                            "display": "flex",
+                                            "alignItems": "center",
+                                            "justifyContent": "space-between",
+                                        },
+                                        children=[
+                                            html.P(
+                                                "Заряд зоны: ",
+                                                style={"fontWeight": "bold"},
+                                            ),
+                                            html.P(
+                                                id="charge_data",
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="twelve columns",
+                                        style={
+                                            "display": "flex",
+                                            "alignItems": "center",
+                                            "justifyContent": "space-between",
+                                        },
+                                        children=[
+                                            html.P(
+                                                "Количество батарей у чарджера: ",
+                                                style={"fontWeight": "bold"},
+                                            ),
+                                            html.P(
+                                                id="batteries_count",
+                                            ),
+                                        ],
+                                    ),
+                                ],
+                                style={"height": "400px"},
+                            ),
+                            html.Div(
+                                className="twelve columns",
+                                children=[
+                                    dcc.Markdown(
+                                        d(
+                                            """
+                                **Диагностика**\n
+                                Длительность этапов итерации и счётчики за последние итерации
+                                всех сессий процесса. Сбор замеров включается при запуске
+                                переменной окружения METRICS_ENABLED=1.
+                                """
+                                        )
+                                    ),
+                                    dcc.Checklist(
+                                        id="diagnostics_visible",
+                                        options=[{"label": "Показывать замеры", "value": "on"}],
+                                        value=[],
+                                    ),
+                                    html.Pre(
+                                        id="diagnostics",
+                                        style={
+                                            "height": "250px",
+                                            "overflowY": "auto",
+                                            "padding": "10px",
+                                            "backgroundColor": "white",
+                                            "border": "1px solid #ccc",
+                                        },
+                                    ),
+                                ],
+                            ),
+                        ],
+                    ),
+                ],
+            ),
+        ]
+    )
+
+
+@callback(
+    [Output("app_root", "children"), Output("loading_interval", "disabled")],
+    Input("loading_interval", "n_intervals"),
+    prevent_initial_call=True,
 )
+def finish_loading(n_intervals):
+    if template.ready():
+        return main_layout(), True
+    if template.error is not None:
+        template.start()
+    return loading_layout(template.error), False
+
+
+def metrics():
+    # Замеры в текстовом формате Prometheus
+    return Response(METRICS.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def create_app(background: bool = True, collect_metrics: bool | None = None) -> dash.Dash:
+    """
+    Создаёт приложение. Граф, из которого создаются сессии, загружается из базы
+    в фоновом потоке, а страница до его загрузки показывает состояние загрузки.
+    :param background: False - загрузить граф до возврата из функции
+    :param collect_metrics: собирать замеры итераций для всего процесса;
+        None - по переменной окружения METRICS_ENABLED
+    """
+    if collect_metrics is None:
+        collect_metrics = os.environ.get("METRICS_ENABLED", "0") == "1"
+    METRICS.enabled = collect_metrics
+    app = dash.Dash(
+        __name__,
+        external_stylesheets=external_stylesheets,
+        # Схема и её обработчики появляются на странице только после загрузки графа
+        suppress_callback_exceptions=True,
+    )
+    app.title = "Граф города"
+    app.layout = serve_layout
+    app.server.add_url_rule("/metrics", view_func=metrics)
+    if background:
+        template.start()
+    else:
+        template.result()
+    return app
 
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    create_app().run_server(debug=True)
@@ -1,11 +1,12 @@
 import json
 
-from dash import Input, Output, State, callback
+from dash import Input, Output, State, callback, no_update
 
 from GraphDB.charger import Charger
-from GraphDB.constants import TARGET_LEVEL, CAN_WRITE
-from GraphDB.functions import make_random_graph, delete_all
-from grapher.misc import graph_to_nodes, get_average_charge, make_graph
+from GraphDB.constants import TARGET_LEVEL
+from GraphDB.generator import NEIGHBOURS, City, to_graph
+from GraphDB.metrics import METRICS
+from grapher.clusters import ClusteredElements, render
 
 from grapher.config import *
 
@@ -26,17 +27,26 @@ def validate_json_output(json_string):
     Output("city_graph", "elements", allow_duplicate=True),
     Input("textarea-submit-button", "n_clicks"),
     State("json-input", "value"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def submit_json(n_clicks, value):
-    global graph, start_pos, charger
+def submit_json(n_clicks, value, session_id):
     if n_clicks > 0:
-        delete_all()
-        make_random_graph(json.loads(value))
-        graph = read_graph()
-        start_pos = Locker.nodes.get(name="Locker 0")
-        charger = Charger(graph, start_pos.node_id)
-        return make_graph(graph)
+        # Город генерируется в памяти только для этой сессии: общая база
+        # и сессии других пользователей не затрагиваются. Его вершин нет в базе,
+        # поэтому граф без SessionOverlay и с базой не синхронизируется
+        params = json.loads(value)
+        city = City(params, seed=params.get("seed"))
+        graph = to_graph(
+            city,
+            params.get("connections", "complete"),
+            params.get("neighbours", NEIGHBOURS),
+            params.get("radius"),
+        )
+        session = Session(graph, Charger(graph, int(city.locker_ids[0])))
+        elements, session.rendered = render(graph)
+        sessions.replace(session_id, session)
+        return elements
 
 
 @callback(
@@ -47,54 +57,91 @@ def submit_json(n_clicks, value):
         Output("batteries_count", "children")
     ],
     Input("next_button", "n_clicks"),
-    State("city_graph", "elements"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def on_button_click(n_clicks, elements):
-    if CAN_WRITE:
-        graph.get_new_info_lockers()
-        graph.get_new_info_scooters()
+def on_button_click(n_clicks, session_id):
+    with METRICS.tick(), sessions.session(session_id) as session:
+        return _next_iteration(session)
+
+
+def _next_iteration(session: Session):
+    graph, charger = session.graph, session.charger
+    expanded_nodes = graph.expanded_nodes
+    if isinstance(graph.writer, SessionOverlay):
+        with METRICS.span("sync_lockers"):
+            graph.writer.sync_lockers()
+        with METRICS.span("sync_scooters"):
+            graph.writer.sync_scooters()
     charge_level = graph.get_average_charge_level()
     if charge_level < TARGET_LEVEL:
-        path, next_vertex, distance = graph.charge_nearest_parking(
-            charger, TARGET_LEVEL
-        )
-        updater.update_lockers(distance)
-        ids = set(i["data"]["id"] for i in elements)
-        elements = [i for i in elements if "source" not in i["data"].keys()]
-        for element in elements:
-            data = element["data"]
-            if data["type"] == "parking":
-                charge, scooterCount = get_average_charge(graph, data)
-                data["average_charge"] = charge
-                data["scooterCount"] = scooterCount
-            if data["type"] == "locker":
-                node = graph.get_node(int(data["id"]))
-                data["status"] = node["status"]
-                data["time_charge_remaining"] = node["time_charge_remaining"]
-        for i in range(len(path) - 1):
-            time_to_travel = graph[path[i]][path[i + 1]]["time_to_travel"]
-            if str(path[i]) + str(path[i + 1]) not in ids:
-                elements.append(
-                    {
-                        "data": {
-                            "id": str(path[i]) + str(path[i + 1]),
-                            "source": str(path[i]),
-                            "target": str(path[i + 1]),
-                            "time_to_travel": time_to_travel,
-                        },
-                    }
-                )
-
-        return elements, "", charge_level, charger.available_batteries
+        with METRICS.span("charge_nearest_parking"):
+            path, next_vertex, distance = graph.charge_nearest_parking(
+                charger, TARGET_LEVEL
+            )
+        METRICS.count("nodes_expanded", graph.expanded_nodes - expanded_nodes)
+        with METRICS.span("flush_writes"):
+            graph.flush_writes()
+        graph.advance_clock(distance)
+        session.history.append((path, next_vertex, distance))
+        with METRICS.span("elements"):
+            if session.rendered is None:
+                # Сессия создана заново (например, вытеснена из кэша): схема отправляется целиком
+                elements, session.rendered = render(graph)
+                update = elements + session.rendered.route_edges(graph, path)
+            else:
+                update = session.rendered.patch(graph, path)
+        return update, "", charge_level, charger.available_batteries
     return (
-        elements,
+        no_update,
         f"Зарядка зоны завершена. Заряд зоны: {graph.get_average_charge_level():.2f}",
         charge_level,
         ""
     )
 
 
+@callback(
+    Output("city_graph", "elements", allow_duplicate=True),
+    Input("city_graph", "tapNodeData"),
+    State("session_id", "data"),
+    prevent_initial_call=True,
+)
+def expand_cluster(data, session_id):
+    # Нажатие на кластер раскрывает его в отдельные парковки и шкафы
+    with sessions.session(session_id) as session:
+        if not isinstance(session.rendered, ClusteredElements) or not data:
+            return no_update
+        elements = session.rendered.select(session.graph, data["id"])
+        return no_update if elements is None else elements
+
+
+@callback(
+    Output("city_graph", "elements", allow_duplicate=True),
+    Input("city_graph", "extent"),
+    State("city_graph", "zoom"),
+    State("session_id", "data"),
+    prevent_initial_call=True,
+)
+def change_viewport(extent, zoom, session_id):
+    with sessions.session(session_id) as session:
+        if not isinstance(session.rendered, ClusteredElements):
+            return no_update
+        elements = session.rendered.set_viewport(session.graph, extent, zoom)
+        return no_update if elements is None else elements
+
+
+@callback(
+    Output("diagnostics", "children"),
+    [Input("charge_data", "children"), Input("diagnostics_visible", "value")],
+)
+def show_diagnostics(charge_data, visible):
+    # Переключатель только показывает замеры в этой вкладке; сбор замеров
+    # включается для всего процесса (create_app(metrics=True) или METRICS_ENABLED=1)
+    if not visible:
+        return ""
+    return METRICS.format_summary()
+
+
 @callback(
     Output("hover_data", "children"),
     Input("city_graph", "mouseoverNodeData"),
@@ -109,12 +156,15 @@ def displayHoverNodeData(data):
 @callback(
     Output("hover_data", "children", allow_duplicate=True),
     Input("city_graph", "tapEdgeData"),
+    State("session_id", "data"),
     prevent_initial_call=True,
 )
-def displayClickEdgeData(data):
+def displayClickEdgeData(data, session_id):
     if data:
         data.pop("id")
         data.pop("timeStamp")
+        with sessions.session(session_id, save=False) as session:
+            graph = session.graph
         source = graph.nodes[int(data["source"])]
         target = graph.nodes[int(data["target"])]
         data["source"] = source
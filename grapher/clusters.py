@@ -0,0 +1,191 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+from dash import Patch
+
+from GraphDB.spatial import GridIndex
+from grapher.misc import RenderedElements, make_graph
+
+# С какого количества парковок и шкафов схема рисуется кластерами
+LOD_THRESHOLD = 1000
+# Сколько парковок и шкафов в среднем попадает в кластер
+CLUSTER_SIZE = 50
+# Начиная с этого масштаба кластеры в видимой области раскрываются
+LOD_ZOOM = 1.5
+# Сколько выбранных нажатием кластеров остаются раскрытыми
+MAX_SELECTED = 3
+
+Cell = Tuple[int, int]
+
+
+class Cluster:
+    """
+    Ячейка сетки над парковками и шкафами и её агрегаты: количество самокатов
+    и сумма их заряда по парковкам кластера.
+    """
+
+    def __init__(self, cell: Cell, vertices: List[int], graph):
+        self.cell = cell
+        self.id = f"cluster_{cell[0]}_{cell[1]}"
+        self.vertices = vertices
+        self.parkings = [v for v in vertices if graph.nodes[v]["type"] == "parking"]
+        self.lockers = [v for v in vertices if graph.nodes[v]["type"] == "locker"]
+        self.position = {
+            "x": int(sum(graph.nodes[v]["lat"] for v in vertices) / len(vertices)),
+            "y": int(sum(graph.nodes[v]["lon"] for v in vertices) / len(vertices)),
+        }
+        self.scooters = 0
+        self.charge_sum = 0.0
+
+    def data(self, graph) -> dict:
+        return {
+            "id": self.id,
+            "label": f"{len(self.parkings)} парк.",
+            "type": "cluster",
+            "average_charge": round(self.charge_sum / self.scooters, 2)
+            if self.scooters
+            else 100,
+            "scooters_count": self.scooters,
+            "parkings": len(self.parkings),
+            "lockers": len(self.lockers),
+            "free_lockers": sum(graph.nodes[v]["status"] == "0" for v in self.lockers),
+        }
+
+
+class ClusteredElements(RenderedElements):
+    """
+    Схема с уровнем детализации: парковки и шкафы сгруппированы в кластеры
+    по ячейкам сетки, кластер показывается одной вершиной с агрегатами и раскрывается
+    в отдельные вершины при приближении или при нажатии на него.
+    Агрегаты кластеров считаются один раз и дальше обновляются по изменившимся
+    парковкам (Graph.take_changed_nodes), а не пересчитываются по всему графу.
+    """
+
+    def __init__(self, graph, cluster_size: int = CLUSTER_SIZE):
+        grid = GridIndex.from_points(
+            (
+                (v, graph.nodes[v]["lat"], graph.nodes[v]["lon"])
+                for v in graph.exclude_type("scooter")
+            ),
+            per_cell=cluster_size,
+        )
+        self.clusters: Dict[str, Cluster] = {}
+        self.cluster_of: Dict[int, Cluster] = {}
+        for cell in sorted(grid.cells):
+            cluster = Cluster(cell, sorted(grid.cells[cell]), graph)
+            self.clusters[cluster.id] = cluster
+            for vertex in cluster.vertices:
+                self.cluster_of[vertex] = cluster
+        # Последние учтённые в агрегатах количество самокатов и сумма заряда парковок
+        self._parking_state: Dict[int, Tuple[int, float]] = {}
+        self._account(graph, graph.get_nodes_by_type("parking"))
+        self.selected = deque(maxlen=MAX_SELECTED)
+        self.zoomed: set = set()
+        self.path: List[int] = []
+        super().__init__(graph, [])
+
+    def _account(self, graph, parkings: List[int]) -> set:
+        """
+        Переносит изменения парковок в агрегаты их кластеров.
+        :return: изменившиеся кластеры
+        """
+        table = graph.scooters
+        changed = set()
+        for parking in parkings:
+            cluster = self.cluster_of.get(parking)
+            if cluster is None:
+                continue
+            slot = table.parking_slots.get(parking)
+            state = (0, 0.0)
+            if slot is not None:
+                state = (int(table.count[slot]), float(table.charge_sum[slot]))
+            old = self._parking_state.get(parking, (0, 0.0))
+            if state != old:
+                cluster.scooters += state[0] - old[0]
+                cluster.charge_sum += state[1] - old[1]
+                self._parking_state[parking] = state
+                changed.add(cluster.id)
+        return changed
+
+    def expanded(self) -> set:
+        return set(self.selected) | self.zoomed
+
+    def rendered_id(self, vertex: int) -> str:
+        cluster = self.cluster_of.get(vertex)
+        if cluster is None or cluster.id in self.expanded():
+            return str(vertex)
+        return cluster.id
+
+    def elements(self, graph) -> list:
+        """
+        Полный список элементов для текущего набора раскрытых кластеров.
+        """
+        expanded = self.expanded()
+        elements = []
+        for cluster in self.clusters.values():
+            if cluster.id in expanded:
+                elements += make_graph(graph, cluster.vertices)
+            else:
+                elements.append({"data": cluster.data(graph), "position": cluster.position})
+        self.index = {element["data"]["id"]: i for i, element in enumerate(elements)}
+        return elements + self.route_edges(graph, self.path)
+
+    def patch(self, graph, path: List[int]) -> Patch:
+        self.path = path
+        return super().patch(graph, path)
+
+    def _patch_nodes(self, patch: Patch, graph, parkings: List[int], lockers: List[int]) -> None:
+        changed = self._account(graph, parkings)
+        changed.update(self.cluster_of[v].id for v in lockers if v in self.cluster_of)
+        # Вершины свёрнутых кластеров в self.index отсутствуют и пропускаются
+        super()._patch_nodes(patch, graph, parkings, lockers)
+        for cluster_id in changed - self.expanded():
+            data = self.clusters[cluster_id].data(graph)
+            index = self.index[cluster_id]
+            for key in ("average_charge", "scooters_count", "free_lockers"):
+                patch[index]["data"][key] = data[key]
+
+    def select(self, graph, cluster_id: str) -> list | None:
+        """
+        Раскрывает кластер, на который нажали.
+        :return: новый список элементов или None, если кластер уже раскрыт
+        """
+        if cluster_id not in self.clusters or cluster_id in self.expanded():
+            return None
+        self.selected.append(cluster_id)
+        return self.elements(graph)
+
+    def set_viewport(self, graph, extent: dict | None, zoom: float | None) -> list | None:
+        """
+        Раскрывает кластеры в видимой области при масштабе не меньше LOD_ZOOM
+        и сворачивает их обратно при отдалении.
+        :param extent: видимая область в координатах схемы (x1, y1, x2, y2)
+        :return: новый список элементов или None, если раскрытые кластеры не изменились
+        """
+        zoomed = set()
+        if extent is not None and zoom is not None and zoom >= LOD_ZOOM:
+            zoomed = {
+                cluster.id
+                for cluster in self.clusters.values()
+                if extent["x1"] <= cluster.position["x"] <= extent["x2"]
+                and extent["y1"] <= cluster.position["y"] <= extent["y2"]
+            }
+        if zoomed == self.zoomed:
+            return None
+        self.zoomed = zoomed
+        return self.elements(graph)
+
+
+def render(graph) -> Tuple[list, RenderedElements]:
+    """
+    Элементы схемы и их состояние для частичных обновлений: для больших городов
+    кластерами (ClusteredElements), иначе по вершине на парковку и шкаф.
+    """
+    # Схема строится по текущим данным графа, поэтому накопленные
+    # изменения сбрасываются: следующий patch отправит только новые
+    graph.take_changed_nodes()
+    if len(graph) > LOD_THRESHOLD:
+        rendered = ClusteredElements(graph)
+        return rendered.elements(graph), rendered
+    elements = make_graph(graph)
+    return elements, RenderedElements(graph, elements)
@@ -1,12 +1,16 @@
-from typing import Tuple
+from typing import List, Tuple
 
+from dash import Patch
 
-def graph_to_nodes(graph) -> list:
+
+def graph_to_nodes(graph, vertices=None) -> list:
+    if vertices is None:
+        vertices = graph.exclude_type("scooter")
     nodes = [
         {
             "data": {
                 "id": str(node),
-                "label": graph.get_node(node)["name"],
+                "label": graph.nodes[node]["name"],
                 **graph.get_node(node),
             },
             "position": {
@@ -14,28 +18,100 @@ def graph_to_nodes(graph) -> list:
                 "y": int(graph.nodes[node]["lon"]),
             },
         }
-        for node in graph.exclude_type("scooter")
+        for node in vertices
     ]
     return nodes
 
 
 def get_average_charge(graph, data) -> Tuple[float, int]:
-    scooters = graph.get_low_scooters_on_parking(int(data["id"]), 101)
-    if len(scooters) > 0:
-        charge = sum(
-            i[next(iter(i))]["charge"] for i in scooters
-        ) / len(scooters)
-    else:
-        charge = 100
-    return charge, len(scooters)
-
-
-def make_graph(graph):
-    nodes = graph_to_nodes(graph)
+    return graph.get_parking_charge(int(data["id"]))
+
+
+def make_graph(graph, vertices=None):
+    nodes = graph_to_nodes(graph, vertices)
     for node in nodes:
         data = node["data"]
         if data["type"] == "parking":
             charge, scootersCount = get_average_charge(graph, data)
             data["average_charge"] = charge
             data["scooters_count"] = scootersCount
-    return nodes
\ No newline at end of file
+        if data["type"] == "locker":
+            data["time_charge_remaining"] = graph.charge_wait(int(data["id"]))
+    return nodes
+
+
+class RenderedElements:
+    """
+    Что сейчас отрисовано в Cytoscape: позиции вершин в списке elements
+    и рёбра маршрута после них. Нужна, чтобы отправлять в браузер только
+    изменения (dash.Patch), а не весь список. patch забирает изменения
+    графа (Graph.take_changed_nodes), поэтому у графа должен быть один такой потребитель.
+    """
+
+    def __init__(self, graph, elements: list):
+        self.index = {element["data"]["id"]: i for i, element in enumerate(elements)}
+        self.edges: List[str] = []
+
+    def patch(self, graph, path: List[int]) -> Patch:
+        """
+        Изменения после итерации: заряд и количество самокатов изменившихся парковок,
+        состояние изменившихся и заряжающихся шкафов, рёбра нового маршрута
+        вместо рёбер прошлого.
+        """
+        patch = Patch()
+        parkings, lockers = graph.take_changed_nodes()
+        self._patch_nodes(patch, graph, parkings, lockers)
+
+        # Рёбра прошлого маршрута лежат после вершин; удаляются с конца,
+        # чтобы не сдвигать ещё не удалённые
+        first = len(self.index)
+        for position in range(len(self.edges) - 1, -1, -1):
+            del patch[first + position]
+        for edge in self.route_edges(graph, path):
+            patch.append(edge)
+        return patch
+
+    def _patch_nodes(self, patch: Patch, graph, parkings: List[int], lockers: List[int]) -> None:
+        for parking in parkings:
+            index = self.index.get(str(parking))
+            if index is None:
+                continue
+            charge, scooters_count = graph.get_parking_charge(parking)
+            patch[index]["data"]["average_charge"] = charge
+            patch[index]["data"]["scooters_count"] = scooters_count
+        for locker in lockers:
+            index = self.index.get(str(locker))
+            if index is None:
+                continue
+            patch[index]["data"]["status"] = graph.nodes[locker]["status"]
+            patch[index]["data"]["time_charge_remaining"] = graph.charge_wait(locker)
+
+    def rendered_id(self, vertex: int) -> str:
+        """
+        Идентификатор элемента, которым вершина показана на схеме.
+        """
+        return str(vertex)
+
+    def route_edges(self, graph, path: List[int]) -> list:
+        """
+        Рёбра маршрута между отрисованными элементами; запоминает их в self.edges.
+        """
+        self.edges = []
+        edges = []
+        for u, v in zip(path, path[1:]):
+            source, target = self.rendered_id(u), self.rendered_id(v)
+            edge_id = source + target
+            if source == target or edge_id in self.edges:
+                continue
+            self.edges.append(edge_id)
+            edges.append(
+                {
+                    "data": {
+                        "id": edge_id,
+                        "source": source,
+                        "target": target,
+                        "time_to_travel": graph[u][v]["time_to_travel"],
+                    },
+                }
+            )
+        return edges
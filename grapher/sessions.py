@@ -0,0 +1,416 @@
+"""
+Состояние пользовательских сессий на сервере: граф, чарджер, отрисованные
+элементы и история маршрута каждой вкладки браузера. Сессии хранятся
+в LRU-кэше процесса с ограничением по размеру и, если задан SQLite-файл,
+в общей для всех рабочих процессов базе: запрос к сессии может прийти
+в любой процесс gunicorn.
+"""
+import pickle
+import sqlite3
+import uuid
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from GraphDB.charger import Charger
+from GraphDB.graph import Graph
+from grapher.misc import RenderedElements
+
+# Как часто (в секундах) SessionStore удаляет из общей базы устаревшие сессии
+PRUNE_INTERVAL = 600
+
+
+class Session:
+    """
+    Состояние одной сессии. history - шаги маршрута (путь, следующая вершина, время пути).
+    rendered - что отрисовано в браузере; None, если схему нужно отправить целиком.
+    """
+
+    def __init__(
+        self, graph: Graph, charger: Charger, rendered: RenderedElements | None = None
+    ):
+        self.graph = graph
+        self.charger = charger
+        self.rendered = rendered
+        self.history: List[Tuple[List[int], int, float]] = []
+        # Версия в общей базе, с которой совпадает это состояние
+        self.version = 0
+
+    def size(self) -> int:
+        """
+        Приблизительный размер в байтах: таблица самокатов, матрица времён пути
+        и по килобайту на вершину и ребро.
+        """
+        graph = self.graph
+        size = graph.scooters.nbytes() + 1024 * (len(graph) + graph.number_of_edges())
+        distances = graph._distances
+        if distances is not None:
+            size += distances.dist.nbytes + distances.next_hop.nbytes
+        return size
+
+
+class SessionOverlay:
+    """
+    Изменения сессии поверх общей базы. Граф сессии передаёт их сюда вместо
+    записи в базу (writer графа: stage и flush), а строки синхронизации с базой
+    проходят через наложение: к заряду самоката из базы добавляется то, что
+    изменила сессия, а шкаф, поставленный сессией на зарядку, остаётся занятым
+    до выставленного ей ready_at. Так сессия видит изменения общей базы
+    (scripts/db_update.py), но не изменения других сессий.
+    Если задан publish (WriteBehindBuffer), изменения ещё и записываются в базу.
+    """
+
+    def __init__(self, graph: Graph, publish=None):
+        self.graph = graph
+        self.publish = publish
+        # Разница между зарядом, выставленным сессией, и зарядом в базе
+        self.charge_offsets: Dict[int, float] = {}
+        # Состояние шкафов, которые сессия поставила на зарядку
+        self.lockers: Dict[int, dict] = {}
+
+    def __len__(self) -> int:
+        return 0 if self.publish is None else len(self.publish)
+
+    def stage(self, node_type: str, node_id: int, data: Dict[str, str | int]) -> None:
+        if node_type == "scooter" and "charge" in data:
+            # Граф вызывает stage до изменения: в таблице ещё прежний заряд
+            before = self.graph.scooters.node(node_id)["charge"]
+            offset = self.charge_offsets.get(node_id, 0.0) + data["charge"] - before
+            self.charge_offsets[node_id] = offset
+        elif node_type == "locker":
+            self.lockers.setdefault(node_id, {}).update(data)
+        if self.publish is not None:
+            self.publish.stage(node_type, node_id, data)
+
+    def flush(self) -> None:
+        if self.publish is not None:
+            self.publish.flush()
+
+    def sync_lockers(self) -> None:
+        """
+        Применяет к графу шкафы, изменённые в базе после прошлой синхронизации.
+        """
+        from GraphDB.sync import fetch_locker_changes
+
+        graph = self.graph
+        self.flush()
+        rows, graph.lockers_synced_at = fetch_locker_changes(graph.lockers_synced_at)
+        merged = []
+        for row in rows:
+            local = self.lockers.get(row[0])
+            if local is not None:
+                if local.get("ready_at", 0.0) > graph.clock:
+                    continue
+                del self.lockers[row[0]]
+            merged.append(row)
+        graph.apply_locker_changes(merged)
+
+    def sync_scooters(self) -> None:
+        """
+        Применяет к графу самокаты, изменённые или удалённые в базе после
+        прошлой синхронизации.
+        """
+        from GraphDB.sync import fetch_scooter_changes
+
+        graph = self.graph
+        self.flush()
+        rows, deleted, graph.scooters_synced_at = fetch_scooter_changes(
+            graph.scooters_synced_at
+        )
+        offsets = self.charge_offsets
+        merged = [
+            (node_id, name, min(100.0, charge + offsets.get(node_id, 0.0)), parking)
+            for node_id, name, charge, parking in rows
+        ]
+        for node_id in deleted:
+            offsets.pop(node_id, None)
+        graph.apply_scooter_changes(merged, deleted)
+
+
+class SQLiteBackend:
+    """
+    Сессии в файле SQLite, общем для рабочих процессов одной машины.
+    Состояние сохраняется pickle целиком вместе с номером версии.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                       id TEXT PRIMARY KEY,
+                       version INTEGER NOT NULL,
+                       updated_at REAL NOT NULL,
+                       data BLOB NOT NULL
+                   )"""
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS session_locks (
+                       id TEXT PRIMARY KEY,
+                       owner TEXT NOT NULL,
+                       expires_at REAL NOT NULL
+                   )"""
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение SQLite нельзя разделять между потоками
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, session_id: str, timeout: float = 30, lease: float = 60) -> str:
+        """
+        Блокировка сессии, общая для всех рабочих процессов: запросы одной сессии
+        выполняются по очереди, в каком бы процессе они ни оказались.
+        Блокировка освобождается release или истекает через lease секунд,
+        если процесс, взявший её, завершился.
+        :return: владелец блокировки для release
+        """
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.time()
+            with self._connection() as connection:
+                cursor = connection.execute(
+                    """INSERT INTO session_locks (id, owner, expires_at) VALUES (?, ?, ?)
+                       ON CONFLICT(id) DO UPDATE SET
+                           owner = excluded.owner,
+                           expires_at = excluded.expires_at
+                       WHERE session_locks.expires_at < ?""",
+                    (session_id, owner, now + lease, now),
+                )
+            if cursor.rowcount == 1:
+                return owner
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Сессия {session_id} занята другим запросом")
+            time.sleep(0.01)
+
+    def release(self, session_id: str, owner: str) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM session_locks WHERE id = ? AND owner = ?", (session_id, owner)
+            )
+
+    def version(self, session_id: str) -> int | None:
+        row = (
+            self._connection()
+            .execute("SELECT version FROM sessions WHERE id = ?", (session_id,))
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def load(self, session_id: str) -> Session | None:
+        row = (
+            self._connection()
+            .execute("SELECT version, data FROM sessions WHERE id = ?", (session_id,))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        session = pickle.loads(row[1])
+        session.version = row[0]
+        return session
+
+    def save(self, session_id: str, session: Session) -> None:
+        session.version += 1
+        data = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection() as connection:
+            connection.execute(
+                """INSERT INTO sessions (id, version, updated_at, data) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       version = excluded.version,
+                       updated_at = excluded.updated_at,
+                       data = excluded.data""",
+                (session_id, session.version, time.time(), data),
+            )
+
+    def prune(self, older_than: float) -> None:
+        """
+        Удаляет сессии, не изменявшиеся дольше older_than секунд,
+        и истёкшие блокировки.
+        """
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE updated_at < ?", (now - older_than,))
+            connection.execute("DELETE FROM session_locks WHERE expires_at < ?", (now,))
+
+
+class BackgroundLoader:
+    """
+    Однократная загрузка в фоновом потоке: приложение начинает отвечать сразу,
+    а запросы, которым нужен результат, ждут его в result().
+    После ошибки следующий start() запускает загрузку заново.
+    """
+
+    def __init__(self, load: Callable[[], object]):
+        self._load = load
+        self._thread: threading.Thread | None = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self.error: Exception | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self.error is None:
+                return
+            self.error = None
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, name="loader", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self._result = self._load()
+        except Exception as error:
+            self.error = error
+        finally:
+            self._done.set()
+
+    def ready(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    def result(self, timeout: float | None = None):
+        """
+        Результат загрузки; запускает её, если она ещё не начата.
+        """
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError("Загрузка не завершилась за отведённое время")
+        if self.error is not None:
+            raise self.error
+        return self._result
+
+
+class SessionStore:
+    """
+    Сессии по идентификатору. Кэш процесса вытесняет давно не использованные
+    сессии, когда их суммарный размер превышает max_bytes. С общей базой
+    каждое изменение сохраняется в неё, а копия в кэше используется,
+    только пока её версия совпадает с версией в базе.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Session],
+        max_bytes: int = 512 * 1024**2,
+        backend: SQLiteBackend | None = None,
+        ttl: float | None = None,
+    ):
+        """
+        :param factory: создаёт состояние новой сессии
+        :param ttl: через сколько секунд без изменений сессия удаляется из общей базы
+        """
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # Блокировки сессий и количество запросов, которые держат или ждут каждую
+        self._locks: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._cache
+
+    def _acquire_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_lock(self, session_id: str) -> None:
+        # Блокировка удаляется, когда её не держит и не ждёт ни один запрос
+        with self._lock:
+            entry = self._locks[session_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    @contextmanager
+    def _locked(self, session_id: str) -> Iterator[None]:
+        # Блокировка процесса упорядочивает потоки, блокировка в общей базе - процессы
+        lock = self._acquire_lock(session_id)
+        try:
+            with lock:
+                if self.backend is None:
+                    yield
+                    return
+                owner = self.backend.acquire(session_id)
+                try:
+                    yield
+                finally:
+                    self.backend.release(session_id, owner)
+        finally:
+            self._release_lock(session_id)
+
+    def _get(self, session_id: str) -> Session:
+        with self._lock:
+            session = self._cache.get(session_id)
+            if session is not None:
+                self._cache.move_to_end(session_id)
+        if self.backend is not None:
+            version = self.backend.version(session_id)
+            if version is not None and (session is None or session.version != version):
+                session = self.backend.load(session_id)
+        if session is None:
+            session = self.factory()
+        return session
+
+    def _put(self, session_id: str, session: Session) -> None:
+        with self._lock:
+            self._cache[session_id] = session
+            self._cache.move_to_end(session_id)
+            self._sizes[session_id] = session.size()
+            total = sum(self._sizes.values())
+            while total > self.max_bytes and len(self._cache) > 1:
+                evicted, _ = self._cache.popitem(last=False)
+                total -= self._sizes.pop(evicted)
+        self._prune()
+
+    def _prune(self) -> None:
+        # Не чаще раза в PRUNE_INTERVAL: удаление идёт запросом к общей базе
+        if self.backend is None or self.ttl is None:
+            return
+        with self._lock:
+            if time.monotonic() - self._pruned_at < PRUNE_INTERVAL:
+                return
+            self._pruned_at = time.monotonic()
+        self.backend.prune(self.ttl)
+
+    @contextmanager
+    def session(self, session_id: str, save: bool = True) -> Iterator[Session]:
+        """
+        Состояние сессии на время обработки запроса; запросы одной сессии
+        выполняются по очереди, с общей базой - и между процессами. По выходу состояние возвращается в кэш
+        и, если save, сохраняется в общую базу.
+        """
+        with self._locked(session_id):
+            session = self._get(session_id)
+            yield session
+            if save and self.backend is not None:
+                self.backend.save(session_id, session)
+            self._put(session_id, session)
+
+    def replace(self, session_id: str, session: Session) -> None:
+        """
+        Заменяет состояние сессии, например после генерации нового города.
+        """
+        with self._locked(session_id):
+            if self.backend is not None:
+                session.version = self.backend.version(session_id) or 0
+                self.backend.save(session_id, session)
+            self._put(session_id, session)
@@ -1,4 +1,6 @@
-from grapher.app_layout import app
+from grapher.app_layout import create_app
+
+app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+"""
+Сравнение задержки точечных запросов: иерархия сжатия, Дейкстра и A*
+на сгенерированных городах с разреженным графом дорог (connections="knn").
+Запуск: python -m scripts.bench_contraction --sizes 1000,10000,50000
+"""
+import argparse
+import random
+import time
+
+from GraphDB.contraction import ContractionHierarchy
+from GraphDB.generator import City, to_graph
+
+
+def measure(query, pairs) -> tuple:
+    start = time.perf_counter()
+    results = [query(a, b) for a, b in pairs]
+    return (time.perf_counter() - start) / len(pairs), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'вершин':>8} {'сжатие, с':>10} {'CH, мс':>8} {'Дейкстра, мс':>13} {'A*, мс':>8}")
+    for size in map(int, args.sizes.split(",")):
+        city = City(
+            {
+                "parkingCount": size - size // 10,
+                "lockerCount": size // 10,
+                "scooterCount": 0,
+                "squareSize": 100 * int(size**0.5),
+            },
+            seed=args.seed,
+        )
+        graph = to_graph(city, "knn")
+        start = time.perf_counter()
+        hierarchy = ContractionHierarchy.from_graph(graph)
+        build_time = time.perf_counter() - start
+
+        rnd = random.Random(args.seed)
+        vertices = graph.exclude_type("scooter")
+        pairs = [rnd.sample(vertices, 2) for _ in range(args.queries)]
+        ch_time, ch_results = measure(hierarchy.query, pairs)
+        dijkstra_time, dijkstra_results = measure(
+            lambda a, b: graph.dijkstra(a, b, False), pairs
+        )
+        astar_time, _ = measure(lambda a, b: graph.astar(a, b, False), pairs)
+        for (_, expected), (_, actual) in zip(dijkstra_results, ch_results):
+            assert abs(expected - actual) < 1e-6, (expected, actual)
+        print(
+            f"{size:>8} {build_time:>10.2f} {ch_time * 1000:>8.3f} "
+            f"{dijkstra_time * 1000:>13.3f} {astar_time * 1000:>8.3f}"
+        )
@@ -0,0 +1,231 @@
+"""
+Замеры горячих путей GraphDB на сгенерированных городах нескольких размеров:
+время вызова, вызовов в секунду и пиковая память (tracemalloc).
+Результаты сохраняются в JSON, чтобы сравнивать прогоны на разных коммитах.
+read_graph работает с заменой базы, отвечающей строками того же города,
+Neo4j не нужен.
+Запуск: python -m scripts.bench_hot_paths --sizes 40,400,4000 --output bench.json
+        python -m scripts.bench_hot_paths --compare bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+from unittest import mock
+
+from GraphDB import functions, sync
+from GraphDB.charger import Charger
+from GraphDB.constants import TARGET_LEVEL
+from GraphDB.generator import City, to_graph
+from GraphDB.graph import Graph
+from GraphDB.simulation import Simulation
+from GraphDB.writer import WriteBehindBuffer
+
+
+class CityDatabase:
+    """
+    Замена neomodel.db для read_graph: отвечает на его запросы строками города.
+    """
+
+    def __init__(self, graph: Graph):
+        self.parkings = [
+            [n, graph.nodes[n]["name"], graph.nodes[n]["lat"], graph.nodes[n]["lon"], 20]
+            for n in graph.get_nodes_by_type("parking")
+        ]
+        table = graph.scooters
+        ids = table.all_ids()
+        rows = table.rows.get_many(ids)
+        parkings = table.parkings_of(rows)
+        self.scooters = [
+            [s, f"Scooter {s}", charge, p, p, 0]
+            for s, charge, p in zip(ids.tolist(), table.charge[rows].tolist(), parkings.tolist())
+        ]
+        self.lockers = [
+            [n, graph.nodes[n]["name"], graph.nodes[n]["lat"], graph.nodes[n]["lon"], 20, "0", 0.0, 0]
+            for n in graph.get_nodes_by_type("locker")
+        ]
+        self.paths = [[u, v, data["time_to_travel"]] for u, v, data in graph.edges(data=True)]
+
+    def cypher_query(self, query: str, params=None):
+        if ":Clock" in query:
+            return [[None, 0.0]], None
+        if "HAS_SCOOTER" in query:
+            return self.scooters, None
+        if ":PATH" in query:
+            return self.paths, None
+        if "(l:Locker)" in query:
+            return self.lockers, None
+        if "(p:Parking)" in query:
+            return self.parkings, None
+        raise NotImplementedError(query)
+
+
+class MemoryWriter(WriteBehindBuffer):
+    """
+    Буфер записи без базы: изменения накапливаются и сбрасываются так же,
+    как в WriteBehindBuffer, а запись только собирает строки запроса.
+    Нужен, чтобы замеры update_node включали подготовку записи.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.written = 0
+
+    def _write(self, pending) -> None:
+        for nodes in pending.values():
+            rows = [{"node_id": node_id, "props": props} for node_id, props in nodes.items()]
+            self.written += len(rows)
+
+
+def make_city(parkings: int, seed: int) -> City:
+    # Пропорции города по умолчанию: 40 парковок, 10 шкафов, 150 самокатов
+    return City(
+        {
+            "parkingCount": parkings,
+            "lockerCount": max(parkings // 4, 1),
+            "scooterCount": parkings * 15 // 4,
+            "squareSize": 1000 * max(int((parkings / 40) ** 0.5), 1),
+        },
+        seed=seed,
+    )
+
+
+def measure(call: Callable[[int], object], calls: int, memory_calls: int) -> Dict:
+    """
+    Время calls вызовов call(i) и пиковая память отдельного прогона
+    из memory_calls вызовов: tracemalloc замедляет выполнение и искажал бы время.
+    """
+    start = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for i in range(memory_calls):
+        call(calls + i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "calls": calls,
+        "seconds": seconds,
+        "ms_per_call": seconds / calls * 1000,
+        "calls_per_second": calls / seconds if seconds > 0 else float("inf"),
+        "peak_bytes": peak - base,
+    }
+
+
+def bench_size(parkings: int, seed: int, connections: str, calls: int) -> Dict[str, Dict]:
+    city = make_city(parkings, seed)
+    rnd = random.Random(seed)
+    results = {}
+    memory_calls = max(calls // 10, 1)
+
+    graphs: List[Graph] = []
+    results["to_graph"] = measure(
+        lambda i: graphs.append(to_graph(city, connections)), 1, 1
+    )
+    graph = graphs[0]
+    vertices = graph.exclude_type("scooter")
+    lockers = graph.get_nodes_by_type("locker")
+    scooters = graph.get_nodes_by_type("scooter")
+
+    database = CityDatabase(graph)
+    with mock.patch.object(functions, "db", database), mock.patch.object(sync, "db", database):
+        results["read_graph"] = measure(
+            lambda i: functions.read_graph(with_distances=False), 1, 1
+        )
+
+    pairs = [rnd.sample(vertices, 2) for _ in range(calls + memory_calls)]
+    results["dijkstra"] = measure(lambda i: graph.dijkstra(*pairs[i], False), calls, memory_calls)
+
+    # Ранжирование кэшируется до изменения агрегатов, поэтому перед каждым
+    # вызовом меняется заряд одного самоката, как за итерацию симуляции
+    def low_level(i: int):
+        graph.scooters.set_charge(scooters[i % len(scooters)], rnd.uniform(0, 100))
+        return graph.find_low_level_vertices(TARGET_LEVEL)
+
+    results["find_low_level_vertices"] = measure(low_level, calls, memory_calls)
+
+    low = graph.find_low_level_vertices(TARGET_LEVEL) or graph.get_nodes_by_type("parking")
+    results["find_nearest_from_array"] = measure(
+        lambda i: graph.find_nearest_from_array(low, lockers[i % len(lockers)]),
+        calls,
+        memory_calls,
+    )
+
+    graph.writer = MemoryWriter()
+    charger = Charger(graph, lockers[0])
+
+    def distribute(i: int):
+        charger.available_batteries = 20
+        charger.distribute_batteries(low[i % len(low)], TARGET_LEVEL)
+        graph.flush_writes()
+
+    results["distribute_batteries"] = measure(distribute, calls, memory_calls)
+
+    simulation = Simulation(to_graph(city, connections), seed=seed)
+    results["simulation_tick"] = measure(lambda i: simulation.tick(), calls, memory_calls)
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict, baseline: Dict | None = None) -> None:
+    print(f"{'парковок':>8} {'функция':<24} {'мс/вызов':>10} {'вызовов/с':>11} {'пик, КБ':>9}")
+    for size, functions_results in results["sizes"].items():
+        for name, row in functions_results.items():
+            line = (
+                f"{size:>8} {name:<24} {row['ms_per_call']:>10.3f} "
+                f"{row['calls_per_second']:>11.1f} {row['peak_bytes'] / 1024:>9.1f}"
+            )
+            old = (baseline or {}).get("sizes", {}).get(size, {}).get(name)
+            if old is not None and row["ms_per_call"] > 0:
+                line += f"  x{old['ms_per_call'] / row['ms_per_call']:.2f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры горячих путей GraphDB")
+    parser.add_argument("--sizes", default="40,400,4000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--connections", default="knn", choices=["complete", "knn"])
+    parser.add_argument("--output", default=None, help="файл для результатов в JSON")
+    parser.add_argument(
+        "--compare", default=None, help="JSON прошлого прогона: выводится ускорение относительно него"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "connections": args.connections,
+        "sizes": {
+            size: bench_size(int(size), args.seed, args.connections, args.calls)
+            for size in args.sizes.split(",")
+        },
+    }
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,101 @@
+"""
+Время импорта точек входа приложения в чистом интерпретаторе: сколько стоит
+холодный старт процесса, какие тяжёлые зависимости подтягиваются и какие
+прямые импорты выполняются дольше всего (по python -X importtime).
+Запуск: python -m scripts.bench_imports --repeat 5 --output imports.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List
+
+ENTRY_POINTS = [
+    "GraphDB.graph",
+    "GraphDB.fleet",
+    "GraphDB.zones",
+    "GraphDB.shift",
+    "GraphDB.simulation",
+    "GraphDB.functions",
+    "grapher.sessions",
+    "grapher.config",
+    "grapher.app_layout",
+    "main",
+]
+# Зависимости, без которых граф и планировщики должны импортироваться
+HEAVY_MODULES = ["neomodel", "neo4j", "dash", "plotly", "flask"]
+
+CODE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def run(module: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    options = ["-X", "importtime"] if importtime else []
+    return subprocess.run(
+        [sys.executable, *options, "-c", CODE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+    )
+
+
+def slowest_imports(stderr: str, top: int) -> List[List]:
+    """
+    Прямые импорты с наибольшим суммарным временем импорта, в мс.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Каждый уровень вложенности добавляет два пробела; нужны прямые импорты
+        if (len(name) - len(name.lstrip()) - 1) // 2 != 1:
+            continue
+        rows.append([name.strip(), int(cumulative) / 1000])
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def measure(module: str, repeat: int, top: int) -> Dict:
+    seconds = []
+    for _ in range(repeat):
+        result = run(module)
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        seconds.append(float(result.stdout.splitlines()[0]))
+    heavy = result.stdout.splitlines()[1]
+    return {
+        "ms": min(seconds) * 1000,
+        "heavy": heavy.split(",") if heavy else [],
+        "slowest": slowest_imports(run(module, importtime=True).stderr, top),
+    }
+
+
+def print_results(results: Dict[str, Dict]) -> None:
+    print(f"{'точка входа':<20} {'мс':>8}  тяжёлые зависимости / самые долгие импорты")
+    for module, row in results.items():
+        if "error" in row:
+            print(f"{module:<20} {'-':>8}  {row['error']}")
+            continue
+        slowest = ", ".join(f"{name} {ms:.0f}" for name, ms in row["slowest"])
+        print(f"{module:<20} {row['ms']:>8.1f}  [{', '.join(row['heavy'])}] {slowest}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время импорта точек входа")
+    parser.add_argument("--modules", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5, help="берётся лучший из прогонов")
+    parser.add_argument("--top", type=int, default=3)
+    parser.add_argument("--output", default=None, help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = {
+        module: measure(module, args.repeat, args.top) for module in args.modules.split(",")
+    }
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
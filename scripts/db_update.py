@@ -2,75 +2,102 @@ import random
 from time import sleep
 
 from neomodel import config, db
-from GraphDB.models import Locker, Scooter, Parking
+from GraphDB.models import NEXT_VERSION, next_version, now_ms
+from GraphDB.sync import TOMBSTONE_TTL, fetch_clock, prune_deleted_scooters, store_clock
+from GraphDB.updater import plan_random_changes
 
 
 class Updater:
-    """Класс для обновления данных в базе. Не является обязательной частью системы"""
+    """Класс для обновления данных в базе. Не является обязательной частью системы.
+    Все операции выполняются запросами над множествами вершин, а не через save() каждой вершины.
+    Для графа в памяти есть реализация с тем же интерфейсом: GraphDB.updater.InMemoryUpdater"""
     TIME_BETWEEN_UPDATES = 10
 
+    def __init__(self):
+        # Часы симуляции, по которым шкафам выставляется ready_at; хранятся в базе
+        # (GraphDB.sync.fetch_clock), чтобы граф и обновление базы шли по одному времени
+        self.clock = 0.0
+
     @db.transaction
     def decrease_scooter_charge(self, percent):
-        for scooter in Scooter.nodes.all():
-            scooter.charge -= percent
-            scooter.save()
+        db.cypher_query(
+            NEXT_VERSION
+            + "MATCH (s:Scooter) SET s.charge = s.charge - $percent, s.updated_at = version",
+            {"percent": percent},
+        )
 
     @db.transaction
-    def random_change_scooters(self):
-        weights = {"change_parking": 45, "remove": 35, "add": 30}
-        scooters = Parking.nodes.fetch_relations("has_scooter").all()
-        if len(scooters) == 0:
-            return
-        scooters = list(map(lambda x: [x[0], x[1]], scooters))
-        scooters_count = len(scooters)
-        changes_count = random.randint(3, scooters_count)
-        actions = random.choices(
-            list(weights.keys()), weights=list(weights.values()), k=changes_count
+    def random_change_scooters(self, max_changes=None):
+        scooters, _ = db.cypher_query(
+            "MATCH (p:Parking)-[:HAS_SCOOTER]->(s:Scooter) RETURN p.node_id, s.node_id"
+        )
+        parkings, _ = db.cypher_query("MATCH (p:Parking) RETURN p.node_id")
+        moves, removed, added = plan_random_changes(
+            [tuple(row) for row in scooters],
+            [row[0] for row in parkings],
+            random,
+            lambda: random.getrandbits(32),
+            max_changes,
         )
-        parkings = Parking.nodes.all()
-        for i in actions:
-            match i:
-                case "change_parking":
-                    index = random.randint(0, scooters_count - 1)
-                    prev_parking, scooter = scooters[index]
-                    prev_parking.has_scooter.disconnect(scooter)
-                    new_parking = random.choice(parkings)
-                    new_parking.has_scooter.connect(scooter)
-                    scooter.set_parking(new_parking.node_id)
-                    scooters[index] = [new_parking, scooter]
-                case "remove":
-                    scooter_parking = scooters[random.randint(0, scooters_count - 1)]
-                    prev_parking = scooter_parking[0]
-                    scooter = scooter_parking[1]
-                    prev_parking.has_scooter.disconnect(scooter)
-                    scooter.delete()
-                    scooters.remove(scooter_parking)
-                    scooters_count -= 1
-                case "add":
-                    new_scooter = Scooter(
-                        charge=random.randint(45, 100), name="Scooter"
-                    ).save()
-                    parking = random.choice(parkings)
-                    parking.has_scooter.connect(new_scooter)
-                    new_scooter.set_parking(parking.node_id)
-                    scooters.append([parking, new_scooter])
-                    scooters_count += 1
+        version = next_version()
+        if moves:
+            db.cypher_query(
+                """UNWIND $moves AS move
+                   MATCH (s:Scooter {node_id: move.scooter})
+                   MATCH (p:Parking {node_id: move.parking})
+                   OPTIONAL MATCH (:Parking)-[r:HAS_SCOOTER]->(s)
+                   DELETE r
+                   WITH DISTINCT s, p
+                   CREATE (p)-[:HAS_SCOOTER]->(s)
+                   SET s.parking = p.node_id, s.updated_at = $version""",
+                {
+                    "moves": [
+                        {"scooter": scooter, "parking": parking}
+                        for scooter, parking in moves.items()
+                    ],
+                    "version": version,
+                },
+            )
+        if removed:
+            db.cypher_query(
+                """UNWIND $removed AS node_id
+                   MATCH (s:Scooter {node_id: node_id})
+                   MERGE (d:DeletedScooter {node_id: node_id})
+                   SET d.updated_at = $version, d.deleted_at = $now
+                   DETACH DELETE s""",
+                {"removed": removed, "version": version, "now": now_ms()},
+            )
+        if added:
+            db.cypher_query(
+                """UNWIND $added AS row
+                   MATCH (p:Parking {node_id: row.parking})
+                   CREATE (p)-[:HAS_SCOOTER]->(:Scooter {
+                       node_id: row.node_id, name: "Scooter", charge: row.charge,
+                       parking: row.parking, updated_at: $version
+                   })""",
+                {
+                    "added": [
+                        {"node_id": scooter, "parking": parking, "charge": charge}
+                        for scooter, (parking, charge) in added.items()
+                    ],
+                    "version": version,
+                },
+            )
 
     @db.transaction
     def update_lockers(self, time_passed: int):
         """
+        Переводит часы вперёд и освобождает только шкафы, у которых наступило время готовности.
         :param time_passed: сколько времени прошло между вызовами функции
         :return: None
         """
-        lockers = Locker.nodes.filter(status="1")
-        for locker in lockers:
-            if locker.time_charge_remaining > time_passed:
-                locker.time_charge_remaining -= time_passed
-            else:
-                locker.time_charge_remaining = 0
-                locker.status = "0"
-            locker.save()
-
+        self.clock = fetch_clock() + time_passed
+        store_clock(self.clock)
+        db.cypher_query(
+            """MATCH (l:Locker {status: "1"}) WHERE l.ready_at <= $clock
+               SET l.status = "0", l.updated_at = $version""",
+            {"clock": self.clock, "version": next_version()},
+        )
 
 
 if __name__ == "__main__":
@@ -80,4 +107,6 @@ if __name__ == "__main__":
         print("Randomizing....")
         updater.random_change_scooters()
         updater.decrease_scooter_charge(0.4)
+        updater.update_lockers(Updater.TIME_BETWEEN_UPDATES)
+        prune_deleted_scooters(now_ms() - TOMBSTONE_TTL)
         sleep(5)
@@ -0,0 +1,37 @@
+import pickle
+
+import pytest
+
+pytest.importorskip("dash")
+pytest.importorskip("dash_cytoscape")
+pytest.importorskip("flask")
+pytest.importorskip("colour")
+
+from GraphDB.generator import City, to_graph
+from grapher import app_layout, config
+from grapher.sessions import BackgroundLoader
+
+
+def load_city() -> bytes:
+    graph = to_graph(City({"parkingCount": 10, "lockerCount": 2, "scooterCount": 30}, seed=1))
+    return pickle.dumps((graph, graph.get_nodes_by_type("locker")[0]))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # Граф для сессий строится в памяти, без базы
+    template = BackgroundLoader(load_city)
+    monkeypatch.setattr(config, "template", template)
+    monkeypatch.setattr(app_layout, "template", template)
+    return app_layout.create_app(background=False, collect_metrics=True)
+
+
+def test_create_app_serves_layout(app):
+    client = app.server.test_client()
+    assert client.get("/_dash-layout").status_code == 200
+
+
+def test_create_app_serves_metrics(app):
+    response = app.server.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("dash")
+
+from GraphDB import sync
+from GraphDB.charger import Charger
+from GraphDB.generator import City, to_graph
+from grapher import sessions
+from grapher.sessions import Session, SessionOverlay, SessionStore, SQLiteBackend
+
+
+@pytest.fixture
+def overlay():
+    graph = to_graph(City({"parkingCount": 10, "lockerCount": 2, "scooterCount": 30}, seed=1))
+    graph.writer = SessionOverlay(graph)
+    return graph.writer
+
+
+def test_session_charge_survives_sync(overlay, monkeypatch):
+    graph = overlay.graph
+    scooter = graph.get_nodes_by_type("scooter")[0]
+    node = graph.scooters.node(scooter)
+    graph.update_node(scooter, {"charge": 100})
+    # В общей базе самокат разрядился на 1 с момента загрузки графа
+    row = (scooter, "s", node["charge"] - 1, node["parking"])
+    monkeypatch.setattr(sync, "fetch_scooter_changes", lambda since: ([row], [], since + 1))
+    overlay.sync_scooters()
+    assert graph.scooters.node(scooter)["charge"] == 99
+    assert graph.scooters_synced_at == 1
+
+
+def test_session_locker_stays_busy_until_ready(overlay, monkeypatch):
+    graph = overlay.graph
+    locker = graph.get_nodes_by_type("locker")[0]
+    Charger(graph, locker)
+    assert locker not in graph.find_available_chargers()
+    rows = [(locker, "0", 0.0)]
+    monkeypatch.setattr(sync, "fetch_locker_changes", lambda since: (rows, since))
+    overlay.sync_lockers()
+    assert locker not in graph.find_available_chargers()
+    graph.advance_clock(10**6)
+    overlay.sync_lockers()
+    assert locker in graph.find_available_chargers()
+    assert overlay.lockers == {}
+
+
+def small_session() -> Session:
+    graph = to_graph(City({"parkingCount": 5, "lockerCount": 1, "scooterCount": 10}, seed=1))
+    return Session(graph, Charger(graph, graph.get_nodes_by_type("locker")[0]))
+
+
+def test_evicted_session_keeps_lock_while_in_use():
+    store = SessionStore(small_session, max_bytes=1)
+    with store.session("a"):
+        pass
+    assert "a" in store
+    with store.session("a"):
+        # Вытесняет "a" из кэша, пока запрос к ней ещё выполняется
+        store.replace("b", small_session())
+        assert "a" not in store
+        assert "a" in store._locks
+    assert store._locks == {}
+
+
+def test_store_prunes_old_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "PRUNE_INTERVAL", 0)
+    backend = SQLiteBackend(str(tmp_path / "sessions.db"))
+    store = SessionStore(small_session, backend=backend, ttl=0)
+    with store.session("a"):
+        pass
+    with store.session("b"):
+        pass
+    assert backend.version("a") is None
@@ -0,0 +1,38 @@
+from GraphDB.charger import Charger
+from GraphDB.generator import City, to_graph
+from GraphDB.shift import ShiftPlanner
+
+
+def city_without_lockers():
+    graph = to_graph(City({"parkingCount": 20, "lockerCount": 0, "scooterCount": 80}, seed=1))
+    return graph, Charger(graph, graph.get_nodes_by_type("parking")[0])
+
+
+def test_plan_without_batteries_and_lockers_is_empty():
+    graph, charger = city_without_lockers()
+    charger.available_batteries = 0
+    route = ShiftPlanner(graph, time_budget=0.1).plan(charger)
+    assert route.visits == []
+    assert route.duration == 0
+
+
+def test_plan_without_lockers_spends_carried_batteries():
+    graph, charger = city_without_lockers()
+    charger.available_batteries = 5
+    route = ShiftPlanner(graph, time_budget=0.1).plan(charger)
+    assert sum(quantity for _, quantity in route.visits) == 5
+    assert all(kind == "charge" for _, kind, _, _ in route.stops)
+
+
+def test_plan_with_all_lockers_charging():
+    graph = to_graph(City({"parkingCount": 20, "lockerCount": 4, "scooterCount": 80}, seed=1))
+    lockers = graph.get_nodes_by_type("locker")
+    charger = Charger(graph, lockers[0])
+    charger.available_batteries = 0
+    graph.apply_locker_changes([(locker, "1", 1000) for locker in lockers])
+    assert graph.find_available_chargers() == []
+    route = ShiftPlanner(graph, time_budget=0.1).plan(charger)
+    assert route.visits
+    # Первая остановка - заезд в шкаф не раньше окончания его зарядки
+    assert route.stops[0][1] == "refill"
+    assert route.stops[0][3] >= 1000